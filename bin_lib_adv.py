@@ -4,72 +4,229 @@
 # In questo file avanzato, useremo direttamente Client da python-binance per i dati grezzi
 # e potremmo importare funzioni di base da binance_lib.py se necessario per calcoli combinati
 # Ad esempio, get_binance_price_pb potrebbe servire qui, ma per il solo volume non serve.
-# Mantengo l'importazione di Client che serve per get_klines.
-from binance.client import Client
+# Le candele vengono scaricate tramite il client condiviso e la cache di binance_lib.py.
+import functools
+import threading
+import time
+
+import numpy as np
+
+from binance_lib import BINANCE_ERRORS, _cached_klines, _get_websocket_manager
 
 # Se in futuro avessimo bisogno, ad esempio, di chiamare get_moving_averages da qui:
 # from binance_lib import get_moving_averages
 
 
+# --- Stream WebSocket delle candele giornaliere ---
+# La candela del giorno corrente cambia ad ogni scambio: invece di richiederla via REST ad ogni analisi,
+# ci iscriviamo allo stream 'kline_1d' di Binance e teniamo in memoria l'ultima versione ricevuta.
+
+# Oltre questa età (in secondi) la candela ricevuta via WebSocket non è considerata attuale e si torna
+# alle richieste REST. Binance invia un aggiornamento kline ogni 2 secondi: 10s coprono qualche
+# messaggio perso senza servire a lungo un volume fermo se lo stream si è bloccato.
+LIVE_CANDLE_MAX_AGE_SECONDS = 10
+
+# Ultima candela giornaliera ricevuta per simbolo: (il dizionario 'k' del messaggio kline, time.monotonic() di ricezione)
+_live_candles: dict[str, tuple[dict, float]] = {}
+# Simboli per cui è già stato aperto uno stream
+_live_candle_symbols: set[str] = set()
+# I messaggi arrivano dal thread del gestore WebSocket, le letture dai thread dei chiamanti
+_live_candles_lock = threading.Lock()
+
+
+def _on_kline(msg: dict, symbols: list[str]) -> None:
+    """Callback degli stream kline: aggiorna la candela corrente del simbolo.
+
+    Args:
+        msg: Il messaggio ricevuto.
+        symbols: I simboli dello stream che ha ricevuto il messaggio (i messaggi di errore non lo indicano).
+    """
+    # Gli stream multiplex incapsulano il messaggio in {'stream': ..., 'data': ...}
+    data = msg.get('data', msg)
+
+    if data.get('e') == 'error':
+        print(f"Errore nello stream WebSocket delle candele per {symbols}: {data.get('m')}")
+        # Scartiamo le candele ricevute finché lo stream non torna a inviarne (intanto si usano le richieste REST).
+        # Lo stream resta sottoscritto: python-binance si riconnette da solo, come per _on_book_ticker.
+        with _live_candles_lock:
+            for symbol in symbols:
+                _live_candles.pop(symbol, None)
+        return
+    if data.get('e') != 'kline':
+        return
+
+    with _live_candles_lock:
+        _live_candles[data['s']] = (data['k'], time.monotonic())
+
+
+def subscribe_live_candles(symbols: list[str]) -> None:
+    """
+    Apre lo stream WebSocket della candela giornaliera per i simboli non ancora sottoscritti.
+
+    Più simboli vengono raggruppati in un unico stream multiplex (una sola connessione).
+
+    Args:
+        symbols: I simboli delle coppie di trading (es. ['ETHUSDT', 'BTCUSDT']).
+    """
+    with _live_candles_lock:
+        new_symbols = sorted({symbol.upper() for symbol in symbols} - _live_candle_symbols)
+        _live_candle_symbols.update(new_symbols)
+
+    if not new_symbols:
+        return
+
+    try:
+        twm = _get_websocket_manager()
+        # Ogni callback conosce i propri simboli, per poterli scartare in caso di errore dello stream
+        callback = functools.partial(_on_kline, symbols=new_symbols)
+        if len(new_symbols) == 1:
+            twm.start_kline_socket(callback=callback, symbol=new_symbols[0], interval='1d')
+        else:
+            twm.start_multiplex_socket(callback=callback, streams=[f"{symbol.lower()}@kline_1d" for symbol in new_symbols])
+    except Exception as e:
+        # Senza stream si continua con le richieste REST. Non riproviamo ad ogni chiamata:
+        # l'avvio fallito del gestore WebSocket blocca per alcuni secondi.
+        print(f"Errore nell'apertura dello stream delle candele per {new_symbols}: {e}")
+
+
+def _live_current_volume(symbol: str) -> float | None:
+    """
+    Restituisce il volume della candela corrente ricevuto via WebSocket se più recente di
+    LIVE_CANDLE_MAX_AGE_SECONDS, altrimenti None (non ancora arrivato o stream fermo).
+    """
+    with _live_candles_lock:
+        live = _live_candles.get(symbol.upper())
+    if live is None:
+        return None
+    candle, received_at = live
+    if time.monotonic() - received_at > LIVE_CANDLE_MAX_AGE_SECONDS:
+        return None
+    # Nel messaggio kline il campo 'v' è il volume (in asset base) della candela
+    return float(candle['v'])
+
+
 # --- Funzioni Avanzate di Analisi ---
 
-def get_current_volume(symbol: str) -> float | None:
+def _volumes_from_klines(symbol: str, klines: np.ndarray, lookback_period: int) -> tuple[float | None, float | None]:
     """
-    Recupera il volume scambiato nel giorno corrente (candela non chiusa) da Binance.
+    Estrae da lookback_period+1 candele giornaliere il volume corrente e il volume medio dei giorni chiusi.
+
+    Args:
+        symbol: Il simbolo della coppia di trading (usato solo per i messaggi).
+        klines: Le candele già convertite (binance_lib._parse_klines), l'ultima è quella del giorno corrente.
+        lookback_period: Il numero di giorni chiusi su cui calcolare la media.
+
+    Returns:
+        Una tupla (volume_corrente, volume_medio), come get_volume_snapshot.
+    """
+    # Se non ci sono candele, non ci sono dati disponibili per quel simbolo/intervallo.
+    if len(klines) == 0:
+        # Questo può succedere per simboli non validi o problemi API
+        print(f"DEBUG: Nessun dato kline trovato per {symbol}.")
+        return None, None
+
+    # Il campo 'volume' è il volume scambiato nel periodo di ciascuna candela
+    volumes = klines['volume']
+    current_volume = float(volumes[-1])
+
+    if lookback_period == 0:
+        return current_volume, None
+
+    # Controlliamo se abbiamo ricevuto abbastanza candele per avere almeno 'lookback_period' CHIUSE
+    if len(klines) < lookback_period + 1:
+        # Se ci sono meno di N+1 candele, significa che l'asset è listato da meno di N giorni
+        # o c'è stato un problema API. Per ora richiediamo N giorni pieni per la media.
+        print(f"Dati storici insufficienti per volume medio {lookback_period}d per {symbol}. Trovati {len(klines)} giorni.")
+        return current_volume, None
+
+    # [-(N+1):-1] prende le N candele chiuse che precedono la candela corrente non chiusa.
+    closing_volumes = volumes[-(lookback_period + 1):-1]
+    average_volume = float(closing_volumes.mean())
+
+    print(f"Candele analizzate: {len(closing_volumes)}")
+
+    return current_volume, average_volume
+
+
+def get_volume_snapshot(symbol: str, lookback_period: int, klines: np.ndarray | None = None) -> tuple[float | None, float | None]:
+    """
+    Recupera con una sola chiamata API il volume del giorno corrente e il volume medio
+    degli ultimi N giorni chiusi.
 
     Args:
         symbol: Il simbolo della coppia di trading (es. 'ETHUSDT').
+        lookback_period: Il numero di giorni (candele chiuse) su cui calcolare la media.
+                         Con 0 viene recuperato solo il volume corrente.
+        klines: Opzionale, candele giornaliere già scaricate con _cached_klines (vengono usate le ultime
+                lookback_period+1). Se non fornite vengono scaricate da Binance.
 
     Returns:
-        Il volume attuale come float, o None in caso di errore o dati mancanti.
+        Una tupla (volume_corrente, volume_medio). Ogni elemento è None se non disponibile
+        (volume_medio è sempre None con lookback_period = 0); (None, None) in caso di errore.
     """
+    if lookback_period < 0:
+        print("Errore: Il lookback period per il volume medio non può essere negativo.")
+        return None, None
+
     try:
-        client = Client("", "") # Inizializza il client (nessuna chiave API necessaria per dati pubblici)
+        if klines is None:
+            # Chiediamo N+1 candele: le prime N sono le giornate CHIUSE, l'ultima è quella
+            # del giorno corrente (non ancora chiusa). Così una sola richiesta serve entrambi i dati.
+            klines = _cached_klines(symbol, '1d', lookback_period + 1)
 
-        # Ottieni l'ultima candela (quella relativa al giorno corrente)
-        # Usiamo intervallo '1d' e limite 1 per ottenere solo la candela del giorno attuale
-        klines = client.get_klines(symbol=symbol.upper(), interval='1d', limit=1)
+        current_volume, average_volume = _volumes_from_klines(symbol, klines, lookback_period)
 
-        # get_klines con limit=1 restituisce una lista contenente 0 o 1 candela.
-        # Se la lista è vuota, non ci sono dati disponibili per quel simbolo/intervallo oggi.
-        if not klines or len(klines) == 0:
-            # Questo può succedere per simboli non validi o problemi API
-            print(f"DEBUG: Nessun dato kline trovato per il giorno corrente per {symbol}.")
-            return None
+        # La candela in cache può avere fino a KLINES_CACHE_TTL_SECONDS secondi: se lo stream
+        # WebSocket è attivo, il suo volume corrente è più aggiornato.
+        subscribe_live_candles([symbol])
+        live_volume = _live_current_volume(symbol)
+        if live_volume is not None and current_volume is not None:
+            current_volume = live_volume
 
-        # La risposta è una lista di liste. klines[0] è la singola candela.
-        # Ogni candela è una lista: [ Open time, Open, High, Low, Close, Volume, Close time, ... ]
-        # L'elemento con indice 5 è il volume scambiato in quel periodo.
-        volume_str = klines[0][5]
+        return current_volume, average_volume
 
-        # Converti il volume da stringa a float
-        current_volume = float(volume_str)
-        return current_volume
+    except BINANCE_ERRORS as e:
+        # Cattura gli errori durante la chiamata API, il parsing della risposta o la conversione
+        print(f"Errore nel recupero dei volumi per {symbol}: {e}")
+        return None, None
 
-    except Exception as e:
-        # Cattura qualsiasi errore durante la chiamata API, il parsing della risposta o la conversione
-        print(f"Errore nel recupero del volume corrente per {symbol}: {e}")
-        return None
 
+def get_current_volume(symbol: str) -> float | None:
+    """
+    Recupera il volume scambiato nel giorno corrente (candela non chiusa) da Binance.
 
-# --- Qui aggiungeremo altre funzioni avanzate (Volume Medio, Bande di Bollinger, RSI, ecc.) ---
+    Il volume viene letto dallo stream WebSocket 'kline_1d' (aperto alla prima chiamata);
+    finché non arriva il primo messaggio si usa la richiesta REST di get_volume_snapshot.
 
-# Esempio di struttura per la media storica dei volumi (la implementeremo dopo)
-# def get_average_historical_volume(symbol: str, lookback_period: int) -> float | None:
-#     """
-#     Calcola il volume medio delle ultime N giornate chiuse.
-#     """
-#     pass # Placeholder
+    Args:
+        symbol: Il simbolo della coppia di trading (es. 'ETHUSDT').
+
+    Returns:
+        Il volume attuale come float, o None in caso di errore o dati mancanti.
+    """
+    subscribe_live_candles([symbol])
+    live_volume = _live_current_volume(symbol)
+    if live_volume is not None:
+        return live_volume
+
+    current_volume, _ = get_volume_snapshot(symbol, 0)
+    return current_volume
+
+
+# --- Qui aggiungeremo altre funzioni avanzate (Bande di Bollinger, RSI, ecc.) ---
 
 
 # --- Nuova Funzione: Volume Medio Storico ---
-def get_average_historical_volume(symbol: str, lookback_period: int) -> float | None:
+def get_average_historical_volume(symbol: str, lookback_period: int, klines: np.ndarray | None = None) -> float | None:
     """
     Calcola il volume medio di scambio degli ultimi N giorni (candele chiuse) da Binance.
 
+    Wrapper di get_volume_snapshot mantenuto per compatibilità.
+
     Args:
         symbol: Il simbolo della coppia di trading.
         lookback_period: Il numero di giorni (candele chiuse) su cui calcolare la media.
+        klines: Opzionale, candele giornaliere già scaricate (vedi get_volume_snapshot).
 
     Returns:
         Il volume medio storico come float, o None in caso di errore o dati insufficienti.
@@ -78,38 +235,8 @@ def get_average_historical_volume(symbol: str, lookback_period: int) -> float |
         print("Errore: Il lookback period per il volume medio deve essere positivo.")
         return None
 
-    try:
-        client = Client("", "")
-
-        # Per calcolare la media su N giorni CHIUSI, dobbiamo chiedere N+1 candele.
-        # Questo perché get_klines(limit=N) include la candela corrente non chiusa.
-        # Chiedendo N+1 e scartando l'ultima, otteniamo le N candele CHIUSE precedenti.
-        klines = client.get_klines(symbol=symbol.upper(), interval='1d', limit=lookback_period + 1)
-
-        # Controlliamo se abbiamo ricevuto abbastanza candele per avere almeno 'lookback_period' CHIUSE
-        if not klines or len(klines) < lookback_period + 1:
-            print(f"Dati storici insufficienti per volume medio {lookback_period}d per {symbol}. Trovati {len(klines) if klines else 0} giorni.")
-            # Se ci sono meno di N+1 candele, significa che l'asset è listato da meno di N giorni
-            # o c'è stato un problema API. Potremmo comunque calcolare la media sui dati disponibili
-            # in una versione più robusta, ma per ora richiediamo N giorni pieni.
-            return None
-
-        # Estraiamo i volumi dalle candele *chiuse*.
-        # Klines[:-1] prende tutti gli elementi tranne l'ultimo (la candela corrente non chiusa).
-        # L'elemento con indice 5 in ogni candela è il volume.
-        closing_volumes = [float(kline[5]) for kline in klines[:-1]]
-
-        # Calcola la media aritmetica dei volumi chiusi
-        average_volume = sum(closing_volumes) / len(closing_volumes) # len(closing_volumes) sarà lookback_period
-
-        print("Candele analizzate: " + len(closing_volumes))
-
-        return average_volume
-
-    except Exception as e:
-        # Cattura errori API o altri problemi
-        print(f"Errore nel calcolo del volume medio storico per {symbol}: {e}")
-        return None
+    _, average_volume = get_volume_snapshot(symbol, lookback_period, klines)
+    return average_volume
 
 
 # --- Nuova Funzione: Genera Segnale Volume ---
@@ -138,18 +265,13 @@ def generate_volume_signal(current_volume: float | None, avg_volume: float | Non
          # Consideriamo STABILE un volume medio non positivo, non possiamo fare confronti significativi
          return "STABILE"
 
-    # Confronta il volume corrente con la media storica usando i fattori soglia
-    if current_volume > avg_volume * high_threshold_factor:
-        # Se il volume attuale è significativamente *sopra* la media
-        return "RIALZISTA" # Mappato come richiesto dall'utente per "Volume Alto"
-
-    elif current_volume < avg_volume * low_threshold_factor:
-        # Se il volume attuale è significativamente *sotto* la media
-        return "RIBASSISTA" # Mappato come richiesto dall'utente per "Volume Basso"
+    # Soglie calcolate una sola volta, poi una singola catena di confronti
+    high_threshold = avg_volume * high_threshold_factor
+    low_threshold = avg_volume * low_threshold_factor
 
-    else:
-        # Se il volume attuale è tra le due soglie (né significativamente alto né basso)
-        return "STABILE" # Mappato come richiesto dall'utente per "Volume Nella Media"
+    # Volume sopra la soglia alta -> "Volume Alto", sotto la soglia bassa -> "Volume Basso",
+    # altrimenti "Volume Nella Media" (mappati come richiesto dall'utente)
+    return "RIALZISTA" if current_volume > high_threshold else "RIBASSISTA" if current_volume < low_threshold else "STABILE"
 
     # NOTA IMPORTANTE: Ribadiamo che questa mappatura ("Volume Alto" -> RIALZISTA, ecc.)
     # è una semplificazione specifica richiesta e NON è la standard analisi del volume nel trading.
@@ -158,34 +280,47 @@ def generate_volume_signal(current_volume: float | None, avg_volume: float | Non
     # Qui stiamo solo valutando il *livello* del volume odierno rispetto alla sua media passata.
 
 
+# Etichette dei codici restituiti da generate_volume_signals
+VOLUME_SIGNAL_LABELS = {1: "RIALZISTA", 0: "STABILE", -1: "RIBASSISTA"}
+
+
+def generate_volume_signals(current_volumes: np.ndarray, avg_volumes: np.ndarray, high_threshold_factor: float = 1.5, low_threshold_factor: float = 0.7) -> np.ndarray:
+    """
+    Versione vettoriale di generate_volume_signal per molti simboli alla volta.
+
+    Args:
+        current_volumes: Array dei volumi correnti (uno per simbolo).
+        avg_volumes: Array dei volumi medi storici, allineato a current_volumes.
+        high_threshold_factor: Come in generate_volume_signal.
+        low_threshold_factor: Come in generate_volume_signal.
+
+    Returns:
+        Un array di interi: 1 (RIALZISTA), -1 (RIBASSISTA), 0 (STABILE, anche per medie non positive).
+        Usa VOLUME_SIGNAL_LABELS per tradurre i codici nelle stringhe di generate_volume_signal.
+    """
+    current_volumes = np.asarray(current_volumes, dtype=np.float64)
+    avg_volumes = np.asarray(avg_volumes, dtype=np.float64)
+
+    high_thresholds = avg_volumes * high_threshold_factor
+    low_thresholds = avg_volumes * low_threshold_factor
+
+    signals = np.where(current_volumes > high_thresholds, 1, np.where(current_volumes < low_thresholds, -1, 0))
+    # Media non positiva -> STABILE, come nella versione scalare
+    return np.where(avg_volumes > 0, signals, 0)
+
+
 # --- Blocco di test per l'esecuzione diretta del file ---
 if __name__ == "__main__":
     print("--- Test Modulo Binance Lib Adv ---")
 
-    # Test per la funzione get_current_volume (già presente e aggiornata per la formattazione)
-    test_symbol_volume = "ETHUSDT"
-    print(f"Recupero volume corrente per {test_symbol_volume}...")
-    volume_oggi = get_current_volume(test_symbol_volume)
-    if volume_oggi is not None:
-        # Formattazione personalizzata (punto in alto per migliaia, punto per decimali)
-        formatted_volume_final = f"{volume_oggi:,.2f}".replace(",", "˙")
-        print(f"Volume scambiato oggi (finora) per {test_symbol_volume}: {formatted_volume_final}")
-    else:
-        print(f"Non è stato possibile ottenere il volume corrente per {test_symbol_volume}.")
-
-    print("-" * 20)
-
-    # Nuovo Test SPECIFICO per l'analisi completa del Volume e il suo segnale
+    # Test per l'analisi completa del Volume e il suo segnale
     test_symbol_volume_analysis = "ETHUSDT"
     volume_avg_lookback = 3 # Periodo per la media del volume storico (es. 30 giorni)
 
     print(f"Analisi volume completa per {test_symbol_volume_analysis} (media su {volume_avg_lookback}gg)...")
 
-    # 1. Recupera il volume corrente (riutilizziamo la variabile se già ottenuta per lo stesso simbolo, altrimenti la richiamiamo)
-    volume_oggi_analysis = volume_oggi if (volume_oggi is not None and test_symbol_volume == test_symbol_volume_analysis) else get_current_volume(test_symbol_volume_analysis)
-
-    # 2. Calcola il volume medio storico
-    avg_volume_history = get_average_historical_volume(test_symbol_volume_analysis, volume_avg_lookback)
+    # 1. e 2. Recupera volume corrente e volume medio storico con una sola chiamata API
+    volume_oggi_analysis, avg_volume_history = get_volume_snapshot(test_symbol_volume_analysis, volume_avg_lookback)
 
     # 3. Genera il segnale volume
     # Definiamo qui le soglie per il test (puoi modificarle)
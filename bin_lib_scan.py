@@ -0,0 +1,183 @@
+# File: bin_lib_scan.py
+
+# Scansione di molti simboli in un solo passaggio.
+# Le candele di tutti i simboli vengono scaricate in parallelo (binance_lib_async.py) e impilate in un
+# unico tensore (simboli, candele, campi); un kernel compilato con Numba calcola poi tutti gli indicatori
+# di ogni simbolo con un solo ciclo sulle candele, distribuendo i simboli sui core disponibili.
+import asyncio
+
+import numpy as np
+from numba import njit, prange
+
+from binance_lib import _parse_klines, generate_crossover_signal
+from bin_lib_adv import VOLUME_SIGNAL_LABELS, generate_volume_signals
+from binance_lib_async import BINANCE_ERRORS, create_session, get_klines
+
+# Colonne del tensore passato a scan (stesso ordine delle candele di Binance)
+OPEN_TIME, OPEN, HIGH, LOW, CLOSE, VOLUME = range(6)
+_TENSOR_FIELDS = ('open_time', 'open', 'high', 'low', 'close', 'volume')
+
+
+@njit(parallel=True, cache=True)
+def scan(arr: np.ndarray, short_n: int, long_n: int, lookback: int):
+    """
+    Calcola gli indicatori di ogni simbolo sul tensore delle candele.
+
+    Args:
+        arr: Tensore float64 di forma (simboli, candele, 6) con le colonne OPEN_TIME..VOLUME;
+             l'ultima candela di ogni simbolo è quella del giorno corrente.
+             Servono almeno max(long_n, lookback + 1) candele.
+        short_n: Il periodo della media mobile breve.
+        long_n: Il periodo della media mobile lunga.
+        lookback: Il numero di giorni per massimo/minimo (breakout) e per il volume medio.
+
+    Returns:
+        Una tupla di array (uno valore per simbolo): SMA breve, SMA lunga, massimo High e minimo Low
+        e volume medio delle 'lookback' candele chiuse (esclusa quella corrente, come in
+        binance_lib.analyze_breakout), volume corrente.
+    """
+    n_symbols, n_bars, _ = arr.shape
+    window = max(long_n, lookback + 1)
+
+    sma_short = np.empty(n_symbols)
+    sma_long = np.empty(n_symbols)
+    max_high = np.empty(n_symbols)
+    min_low = np.empty(n_symbols)
+    mean_volume = np.empty(n_symbols)
+    current_volume = np.empty(n_symbols)
+
+    for i in prange(n_symbols):
+        short_sum = 0.0
+        long_sum = 0.0
+        volume_sum = 0.0
+        highest = -np.inf
+        lowest = np.inf
+
+        # Un solo passaggio sulle ultime 'window' candele: ogni indicatore usa la propria coda
+        for j in range(n_bars - window, n_bars):
+            close = arr[i, j, CLOSE]
+            if j >= n_bars - long_n:
+                long_sum += close
+            if j >= n_bars - short_n:
+                short_sum += close
+            # Breakout e volume medio: le 'lookback' candele chiuse che precedono quella corrente
+            if n_bars - lookback - 1 <= j < n_bars - 1:
+                if arr[i, j, HIGH] > highest:
+                    highest = arr[i, j, HIGH]
+                if arr[i, j, LOW] < lowest:
+                    lowest = arr[i, j, LOW]
+                volume_sum += arr[i, j, VOLUME]
+
+        sma_short[i] = short_sum / short_n
+        sma_long[i] = long_sum / long_n
+        max_high[i] = highest
+        min_low[i] = lowest
+        mean_volume[i] = volume_sum / lookback
+        current_volume[i] = arr[i, n_bars - 1, VOLUME]
+
+    return sma_short, sma_long, max_high, min_low, mean_volume, current_volume
+
+
+async def _fetch_tensor(session, symbols: list[str], n_bars: int) -> tuple[list[str], np.ndarray]:
+    """
+    Scarica in parallelo le ultime n_bars candele giornaliere di ogni simbolo e le impila in un tensore.
+
+    Returns:
+        La lista dei simboli con dati completi e il tensore (simboli, n_bars, 6) corrispondente.
+        I simboli con errori o meno di n_bars candele vengono esclusi (con un messaggio).
+    """
+    responses = await asyncio.gather(
+        *(get_klines(session, symbol, '1d', n_bars) for symbol in symbols),
+        return_exceptions=True,
+    )
+
+    valid_symbols = []
+    rows = []
+    for symbol, response in zip(symbols, responses):
+        if isinstance(response, BaseException):
+            if not isinstance(response, BINANCE_ERRORS):
+                raise response
+            print(f"Errore nel recupero delle candele per {symbol}: {response}")
+            continue
+        try:
+            candles = _parse_klines(response)
+        except ValueError:
+            continue
+        if len(candles) < n_bars:
+            print(f"Dati storici insufficienti per {symbol}. Trovati {len(candles)} giorni su {n_bars}.")
+            continue
+        valid_symbols.append(symbol.upper())
+        rows.append(np.column_stack([candles[field].astype(np.float64) for field in _TENSOR_FIELDS]))
+
+    tensor = np.stack(rows) if rows else np.empty((0, n_bars, len(_TENSOR_FIELDS)))
+    return valid_symbols, tensor
+
+
+async def analyze_symbols_async(session, symbols: list[str], short_n: int = 20, long_n: int = 50, lookback: int = 20) -> dict[str, dict]:
+    """
+    Scarica in parallelo le candele dei simboli e ne calcola gli indicatori con scan.
+
+    Args:
+        session: La sessione HTTP creata con binance_lib_async.create_session.
+        symbols: I simboli delle coppie di trading (es. ['ETHUSDT', 'BTCUSDT']).
+        short_n: Il periodo della media mobile breve.
+        long_n: Il periodo della media mobile lunga.
+        lookback: Il numero di giorni per massimo/minimo e volume medio.
+
+    Returns:
+        Un dizionario simbolo -> indicatori ('sma_short', 'sma_long', 'crossover_signal', 'highest_high',
+        'lowest_low', 'avg_volume', 'current_volume', 'volume_signal'). I simboli senza dati sufficienti
+        non compaiono nel risultato.
+    """
+    if short_n <= 0 or long_n <= 0 or short_n > long_n or lookback <= 0:
+        print("Errore: i periodi devono essere positivi e il periodo breve <= periodo lungo.")
+        return {}
+
+    valid_symbols, tensor = await _fetch_tensor(session, symbols, max(long_n, lookback + 1))
+    if not valid_symbols:
+        return {}
+
+    sma_short, sma_long, max_high, min_low, mean_volume, current_volume = scan(tensor, short_n, long_n, lookback)
+
+    volume_signals = generate_volume_signals(current_volume, mean_volume)
+
+    results = {}
+    for i, symbol in enumerate(valid_symbols):
+        results[symbol] = {
+            'sma_short': float(sma_short[i]),
+            'sma_long': float(sma_long[i]),
+            'crossover_signal': generate_crossover_signal(float(sma_short[i]), float(sma_long[i])),
+            'highest_high': float(max_high[i]),
+            'lowest_low': float(min_low[i]),
+            'avg_volume': float(mean_volume[i]),
+            'current_volume': float(current_volume[i]),
+            'volume_signal': VOLUME_SIGNAL_LABELS[int(volume_signals[i])],
+        }
+    return results
+
+
+def analyze_symbols(symbols: list[str], short_n: int = 20, long_n: int = 50, lookback: int = 20) -> dict[str, dict]:
+    """Versione bloccante di analyze_symbols_async (crea e chiude una sessione dedicata)."""
+    async def _run() -> dict[str, dict]:
+        async with create_session() as session:
+            return await analyze_symbols_async(session, symbols, short_n, long_n, lookback)
+
+    return asyncio.run(_run())
+
+
+# --- Blocco di test per l'esecuzione diretta del file ---
+if __name__ == "__main__":
+    print("--- Test Modulo Binance Lib Scan ---")
+
+    test_symbols = ["BTCUSDT", "ETHUSDT", "BNBUSDT", "SOLUSDT", "XRPUSDT"]
+    print(f"Scansione di {len(test_symbols)} simboli (SMA 20d/50d, breakout e volume su 20gg)...")
+
+    scan_results = analyze_symbols(test_symbols)
+
+    for scanned_symbol, indicators in scan_results.items():
+        print(
+            f"  {scanned_symbol}: SMA {indicators['sma_short']:.2f}/{indicators['sma_long']:.2f} -> {indicators['crossover_signal']}, "
+            f"Max/Min {indicators['highest_high']:.2f}/{indicators['lowest_low']:.2f}, Volume: {indicators['volume_signal']}"
+        )
+
+    print("-" * 20)
@@ -1,24 +1,410 @@
+import functools
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+
+import numpy as np
+import requests
+from binance import ThreadedWebsocketManager
 from binance.client import Client
+from binance.exceptions import BinanceAPIException, BinanceRequestException
+from cachetools import TTLCache
+from requests.adapters import HTTPAdapter
+
+try:
+    import redis
+except ImportError: # redis-py è opzionale: senza, si usa solo la cache in memoria del processo
+    redis = None
+
+# Le candele giornaliere cambiano al massimo una volta al giorno (più l'aggiornamento della candela
+# corrente): tenerle in memoria per qualche decina di secondi evita di riscaricarle quando più
+# indicatori analizzano lo stesso simbolo nello stesso passaggio.
+KLINES_CACHE_TTL_SECONDS = 60
+_klines_cache: TTLCache = TTLCache(maxsize=256, ttl=KLINES_CACHE_TTL_SECONDS)
+# Il bot chiama queste funzioni da più thread (run_in_executor): TTLCache non è thread-safe
+_klines_cache_lock = threading.Lock()
+
+# Cache condivisa tra processi (es. più istanze del bot): attiva solo se è configurato un server Redis,
+# ad esempio BINANCE_REDIS_URL=redis://localhost:6379/0
+REDIS_URL = os.environ.get("BINANCE_REDIS_URL")
+KLINES_REDIS_TTL_SECONDS = 60
+TICKER_REDIS_TTL_SECONDS = 1
+# Un solo pool di connessioni per processo; timeout brevi perché la cache non deve mai rallentare le richieste
+_redis = (
+    redis.Redis(connection_pool=redis.ConnectionPool.from_url(REDIS_URL, socket_timeout=0.5, socket_connect_timeout=0.5))
+    if redis is not None and REDIS_URL
+    else None
+)
+
+# Errori attesi durante le chiamate a Binance: problemi di rete, risposte di errore dell'API
+# (es. simbolo non valido) e risposte con dati malformati (ValueError da _parse_klines o float()).
+# Le funzioni di analisi li gestiscono restituendo None/un messaggio; qualsiasi altra eccezione
+# è un errore di programmazione e deve emergere invece di essere nascosta da un "return None".
+BINANCE_ERRORS = (requests.RequestException, BinanceAPIException, BinanceRequestException, ValueError)
+
+# Binance assegna un "peso" ad ogni richiesta REST e limita la somma a 1200 per minuto (per IP).
+# Sopra questa soglia aspettiamo il minuto successivo invece di rischiare un 429 (o un ban 418).
+USED_WEIGHT_LIMIT = 1100
+
+
+class _UsedWeightGauge:
+    """
+    Tiene traccia del peso REST usato nel minuto corrente, letto dall'header X-MBX-USED-WEIGHT-1M
+    di ogni risposta, e dei blocchi imposti da Binance con 429/418 + Retry-After.
+
+    Condiviso tra il client sincrono e le funzioni di binance_lib_async.py.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._used = 0
+        self._minute_start = 0.0
+        self._blocked_until = 0.0
+
+    def update(self, status_code: int, headers) -> None:
+        """Aggiorna lo stato con una risposta ricevuta (headers: mapping case-insensitive)."""
+        now = time.time()
+        with self._lock:
+            used = headers.get('x-mbx-used-weight-1m')
+            if used is not None:
+                try:
+                    self._used = int(used)
+                    # Il contatore di Binance si azzera allo scadere di ogni minuto
+                    self._minute_start = now - now % 60
+                except ValueError:
+                    pass
+
+            if status_code in (418, 429):
+                # Binance indica in Retry-After (secondi) quanto attendere; in mancanza aspettiamo il minuto successivo
+                retry_after = headers.get('Retry-After')
+                try:
+                    wait = float(retry_after) if retry_after is not None else 60 - now % 60
+                except ValueError:
+                    wait = 60 - now % 60
+                self._blocked_until = max(self._blocked_until, now + wait)
+
+    def delay(self) -> float:
+        """Restituisce quanti secondi attendere prima della prossima richiesta (0 se si può procedere subito)."""
+        now = time.time()
+        with self._lock:
+            if now < self._blocked_until:
+                return self._blocked_until - now
+            if self._used >= self.limit and now - self._minute_start < 60:
+                return 60 - (now - self._minute_start)
+        return 0.0
+
+
+_used_weight = _UsedWeightGauge(USED_WEIGHT_LIMIT)
+
+
+class _WeightAwareAdapter(HTTPAdapter):
+    """HTTPAdapter che rallenta le richieste quando il peso usato si avvicina al limite di Binance."""
+
+    def send(self, request, **kwargs):
+        delay = _used_weight.delay()
+        if delay > 0:
+            print(f"Limite di peso Binance quasi raggiunto: attendo {delay:.1f}s prima della richiesta.")
+            time.sleep(delay)
+
+        response = super().send(request, **kwargs)
+        _used_weight.update(response.status_code, response.headers)
+        return response
+
+
+def _is_transient_error(error: Exception) -> bool:
+    """Indica se un errore di rete/API è temporaneo, cioè se ha senso ripetere la richiesta."""
+    if isinstance(error, BinanceAPIException):
+        # 429/418: limite di richieste superato; 5xx: problema lato Binance. Gli altri 4xx
+        # (es. simbolo non valido) darebbero sempre lo stesso errore.
+        return error.status_code in (418, 429) or error.status_code >= 500
+    return isinstance(error, requests.RequestException)
+
+
+def _retry_after_seconds(error: Exception) -> float | None:
+    """Restituisce il valore dell'header Retry-After della risposta di errore, se presente."""
+    response = getattr(error, 'response', None)
+    retry_after = response.headers.get('Retry-After') if response is not None else None
+    try:
+        return float(retry_after) if retry_after is not None else None
+    except ValueError:
+        return None
+
+
+def _retry(tries: int = 4, delay: float = 0.25, backoff: float = 2.0):
+    """
+    Decoratore: ripete la funzione in caso di errori temporanei (vedi _is_transient_error),
+    aspettando delay, delay*backoff, delay*backoff^2, ... secondi tra un tentativo e l'altro.
+
+    Se Binance indica un Retry-After più lungo, si aspetta quello. Dopo l'ultimo tentativo
+    (o per errori non temporanei) l'eccezione viene propagata al chiamante.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            wait = delay
+            for attempt in range(1, tries + 1):
+                try:
+                    return func(*args, **kwargs)
+                except (requests.RequestException, BinanceAPIException) as e:
+                    if attempt == tries or not _is_transient_error(e):
+                        raise
+                    sleep_for = max(wait, _retry_after_seconds(e) or 0.0)
+                    print(f"Errore temporaneo in {func.__name__} ({e}), nuovo tentativo tra {sleep_for:.2f}s...")
+                    time.sleep(sleep_for)
+                    wait *= backoff
+        return wrapper
+    return decorator
+
+
+@lru_cache(maxsize=1)
+def _get_client() -> Client:
+    """
+    Restituisce il client Binance condiviso dal modulo, creandolo alla prima chiamata.
+
+    Riutilizzare lo stesso client evita di ricreare ad ogni chiamata la requests.Session,
+    il contesto TLS e il ping iniziale: le connessioni HTTP restano aperte (keep-alive).
+    """
+    # Le chiavi API non sono necessarie per accedere ai dati di mercato pubblici
+    client = Client("", "")
+    # Un pool più ampio permette a più chiamanti concorrenti (es. i thread del bot) di condividere connessioni già aperte;
+    # l'adapter legge anche il peso usato da ogni risposta per rispettare il limite al minuto.
+    client.session.mount("https://", _WeightAwareAdapter(pool_connections=16, pool_maxsize=32))
+    return client
+
+
+@lru_cache(maxsize=1)
+def _get_websocket_manager() -> ThreadedWebsocketManager:
+    """
+    Restituisce il gestore WebSocket condiviso dal modulo, avviandolo alla prima chiamata.
+
+    Un solo gestore (un solo thread con il suo event loop) serve tutti gli stream sottoscritti.
+    """
+    twm = ThreadedWebsocketManager()
+    # Thread daemon: gli stream aperti non devono impedire la chiusura del programma
+    twm.daemon = True
+    twm.start()
+    return twm
+
+
+@_retry()
+def _fetch_klines(symbol: str, interval: str, limit: int) -> list:
+    """Scarica le candele da Binance (con nuovi tentativi in caso di errori temporanei)."""
+    return _get_client().get_klines(symbol=symbol.upper(), interval=interval, limit=limit)
+
+
+@_retry()
+def _fetch_symbol_ticker(symbol: str) -> dict:
+    """Scarica il ticker di prezzo da Binance (con nuovi tentativi in caso di errori temporanei)."""
+    return _get_client().get_symbol_ticker(symbol=symbol.upper())
+
+
+def _redis_get_json(key: str) -> list | dict | None:
+    """Legge un valore JSON dalla cache Redis; None se assente, scaduto, o Redis non disponibile."""
+    if _redis is None:
+        return None
+    try:
+        value = _redis.get(key)
+    except redis.RedisError as e:
+        print(f"Cache Redis non disponibile ({e}), proseguo senza.")
+        return None
+    return json.loads(value) if value is not None else None
+
+
+def _redis_set_json(key: str, ttl: int, value: list | dict) -> None:
+    """Salva un valore JSON nella cache Redis con scadenza di ttl secondi (nessun effetto senza Redis)."""
+    if _redis is None:
+        return
+    try:
+        _redis.setex(key, ttl, json.dumps(value))
+    except redis.RedisError as e:
+        print(f"Cache Redis non disponibile ({e}), proseguo senza.")
+
+
+def _redis_cached_klines(symbol: str, interval: str, limit: int, ttl: int = KLINES_REDIS_TTL_SECONDS) -> list:
+    """
+    Restituisce le candele dalla cache Redis condivisa, scaricandole da Binance (e salvandole) se assenti.
+    """
+    key = f"binance:klines:{symbol.upper()}:{interval}:{limit}"
+    klines = _redis_get_json(key)
+    if klines is None:
+        klines = _fetch_klines(symbol, interval, limit)
+        _redis_set_json(key, ttl, klines)
+    return klines
+
+
+def _redis_cached_symbol_ticker(symbol: str, ttl: int = TICKER_REDIS_TTL_SECONDS) -> dict:
+    """
+    Restituisce il ticker di prezzo dalla cache Redis condivisa, scaricandolo da Binance (e salvandolo) se assente.
+    """
+    key = f"binance:ticker:{symbol.upper()}"
+    ticker = _redis_get_json(key)
+    if ticker is None:
+        ticker = _fetch_symbol_ticker(symbol)
+        _redis_set_json(key, ttl, ticker)
+    return ticker
+
+
+# Formato delle candele già convertite. Binance restituisce ogni candela come lista di stringhe
+# [ Open time, Open, High, Low, Close, Volume, Close time, ... ]: le prime 7 colonne diventano campi numerici.
+_KLINE_DTYPE = np.dtype([
+    ('open_time', 'i8'),
+    ('open', 'f8'),
+    ('high', 'f8'),
+    ('low', 'f8'),
+    ('close', 'f8'),
+    ('volume', 'f8'),
+    ('close_time', 'i8'),
+])
+
+
+def _parse_klines(klines: list) -> np.ndarray:
+    """
+    Converte la lista di candele di get_klines in un array strutturato NumPy (_KLINE_DTYPE).
+
+    La conversione da stringa a numero avviene una sola volta per colonna; i campi si leggono
+    poi direttamente, es. candles['close'] o candles['volume'].
+
+    Raises:
+        ValueError: se le candele contengono valori non numerici o righe malformate.
+    """
+    candles = np.empty(len(klines), dtype=_KLINE_DTYPE)
+    if len(klines) == 0:
+        return candles
+
+    try:
+        columns = np.asarray(klines, dtype=object)
+        for index, name in enumerate(_KLINE_DTYPE.names):
+            candles[name] = columns[:, index]
+    except (ValueError, IndexError, TypeError) as e:
+        print(f"Errore nel parsing delle candele: {e}")
+        raise ValueError(f"Candele malformate: {e}") from e
+
+    return candles
+
+
+def _cached_klines(symbol: str, interval: str, limit: int) -> np.ndarray:
+    """
+    Restituisce le ultime 'limit' candele di un simbolo, usando la cache in memoria se ancora valida.
+
+    In cache vengono salvate le candele già convertite (vedi _parse_klines): chi legge dalla cache
+    non ripete la conversione delle stringhe.
+
+    Args:
+        symbol: Il simbolo della coppia di trading (es. 'ETHUSDT').
+        interval: L'intervallo delle candele (es. '1d').
+        limit: Il numero di candele richieste.
+
+    Returns:
+        L'array strutturato delle candele, la più recente per ultima (da non modificare: è condiviso
+        con la cache). Gli errori di rete/API vengono propagati al chiamante.
+    """
+    key = (symbol.upper(), interval, limit)
+    with _klines_cache_lock:
+        klines = _klines_cache.get(key)
+        if klines is None:
+            # Una risposta già in cache con più candele contiene anche quelle richieste:
+            # le ultime 'limit' candele di una serie più lunga sono esattamente le stesse.
+            for (cached_symbol, cached_interval, cached_limit), cached_klines in list(_klines_cache.items()):
+                if cached_symbol == key[0] and cached_interval == interval and cached_limit > limit and len(cached_klines) == cached_limit:
+                    klines = cached_klines[-limit:]
+                    break
+    if klines is not None:
+        return klines
+
+    # Prima di chiedere a Binance proviamo la cache Redis, che può essere stata riempita da un altro processo
+    klines = _parse_klines(_redis_cached_klines(symbol, interval, limit))
+
+    with _klines_cache_lock:
+        _klines_cache[key] = klines
+    return klines
+
+
+# --- Stream WebSocket del prezzo (bookTicker) ---
+# Invece di una richiesta REST per ogni prezzo, teniamo in memoria il miglior bid/ask
+# ricevuto dallo stream 'bookTicker' di Binance, aggiornato ad ogni variazione del book.
+
+# Oltre questa età (in secondi) il prezzo ricevuto via WebSocket non è considerato attuale
+LIVE_PRICE_MAX_AGE_SECONDS = 0.5
+
+# Ultimo prezzo per simbolo: (prezzo medio tra bid e ask, time.monotonic() di ricezione)
+_live_prices: dict[str, tuple[float, float]] = {}
+# Simboli per cui è già stato aperto uno stream
+_live_price_symbols: set[str] = set()
+# I messaggi arrivano dal thread del gestore WebSocket, le letture dai thread dei chiamanti
+_live_prices_lock = threading.Lock()
+
+
+def _on_book_ticker(msg: dict) -> None:
+    """Callback dello stream bookTicker: aggiorna l'ultimo prezzo del simbolo."""
+    if msg.get('e') == 'error':
+        print(f"Errore nello stream WebSocket dei prezzi: {msg.get('m')}")
+        return
+    # Messaggio bookTicker: {'s': simbolo, 'b': miglior bid, 'a': miglior ask, ...}
+    if 's' not in msg or 'b' not in msg or 'a' not in msg:
+        return
+
+    price = (float(msg['b']) + float(msg['a'])) / 2
+    with _live_prices_lock:
+        _live_prices[msg['s']] = (price, time.monotonic())
+
+
+def _subscribe_live_price(symbol: str) -> None:
+    """Apre lo stream bookTicker del simbolo, se non è già stato aperto."""
+    symbol = symbol.upper()
+    with _live_prices_lock:
+        if symbol in _live_price_symbols:
+            return
+        _live_price_symbols.add(symbol)
+
+    try:
+        _get_websocket_manager().start_symbol_book_ticker_socket(callback=_on_book_ticker, symbol=symbol)
+    except Exception as e:
+        # Senza stream si continua con le richieste REST. Non riproviamo ad ogni chiamata:
+        # l'avvio fallito del gestore WebSocket blocca per alcuni secondi.
+        print(f"Errore nell'apertura dello stream dei prezzi per {symbol}: {e}")
+
+
+def _live_price(symbol: str) -> float | None:
+    """Restituisce il prezzo ricevuto via WebSocket se più recente di LIVE_PRICE_MAX_AGE_SECONDS, altrimenti None."""
+    with _live_prices_lock:
+        live = _live_prices.get(symbol.upper())
+    if live is None:
+        return None
+    price, received_at = live
+    return price if time.monotonic() - received_at <= LIVE_PRICE_MAX_AGE_SECONDS else None
+
+
 def get_binance_price_pb(symbol: str) -> float | None:
     """
     Recupera il prezzo attuale di una criptovaluta da Binance usando python-binance.
 
+    Il prezzo viene letto dallo stream WebSocket bookTicker (aperto alla prima chiamata per il simbolo)
+    come media tra miglior bid e miglior ask; se lo stream non ha ancora inviato un prezzo recente
+    si usa la richiesta REST del ticker (ultimo prezzo scambiato).
+
     Args:
         symbol: Il simbolo della coppia di trading (es. 'ETHUSDT').
 
     Returns:
         Il prezzo attuale come float, o None se c'è un errore o il simbolo non è valido.
     """
+    _subscribe_live_price(symbol)
+    live_price = _live_price(symbol)
+    if live_price is not None:
+        return live_price
+
     # Le chiavi API non sono necessarie per accedere ai dati di mercato pubblici
     # Puoi istanziare il client senza API key e Secret per questi scopi.
     try:
-        # Inizializza il client di Binance
-        # Se avessi bisogno di dati utente o trading, metteresti qui la tua API key e Secret
-        client = Client("", "") # Lasciamo vuoto per accesso pubblico
-
-        # Ottieni il ticker per il simbolo specificato
-        # La libreria gestisce la chiamata API HTTP per te
-        ticker = client.get_symbol_ticker(symbol=symbol.upper()) # Simbolo in maiuscolo
+        # Ottieni il ticker per il simbolo specificato tramite il client condiviso
+        # (se avessi bisogno di dati utente o trading, metteresti la tua API key e Secret in _get_client)
+        # La libreria gestisce la chiamata API HTTP per te; gli errori temporanei vengono ritentati
+        # Il ticker passa dalla cache Redis (se configurata) con scadenza di 1 secondo
+        ticker = _redis_cached_symbol_ticker(symbol)
 
         # La risposta è un dizionario {'symbol': '...', 'price': '...'}
         if ticker and 'price' in ticker:
@@ -30,51 +416,47 @@ def get_binance_price_pb(symbol: str) -> float | None:
             print(f"Risposta API inaspettata per simbolo {symbol}: {ticker}")
             return None
 
-    except Exception as e:
+    except BINANCE_ERRORS as e:
         # python-binance solleva eccezioni specifiche in caso di problemi (es. BinanceAPIException per errori API)
-        # Qui catturiamo un'eccezione generica per semplicità
         print(f"Errore durante il recupero del prezzo con python-binance: {e}")
         return None
 
-def get_binance_average_price_30d(symbol: str) -> float | None:
+def get_binance_average_price_30d(symbol: str, klines: np.ndarray | None = None) -> float | None:
     """
     Calcola il prezzo medio di chiusura degli ultimi 30 giorni per una criptovaluta da Binance.
 
     Args:
         symbol: Il simbolo della coppia di trading (es. 'ETHUSDT').
+        klines: Opzionale, candele giornaliere già scaricate con _cached_klines (almeno 30, vengono usate
+                le ultime 30). Se non fornite vengono scaricate da Binance.
 
     Returns:
         Il prezzo medio degli ultimi 30 giorni come float, o None in caso di errore.
     """
     try:
-        client = Client("", "")
-
-        # Ottieni gli ultimi 30 candele giornaliere ('1d')
-        # Client.KLINE_INTERVAL_DAILY è una costante che vale '1d'
-        klines = client.get_klines(symbol=symbol.upper(), interval="1d", limit=30)
-
-        # get_klines può restituire una lista vuota se il simbolo non esiste o non ha dati per quell'intervallo/limite
-        if not klines or len(klines) < 30:
-            print(f"Dati storici insufficienti o non trovati per {symbol}. Trovati {len(klines) if klines else 0} giorni.")
+        if klines is None:
+            # Ottieni le ultime 30 candele giornaliere ('1d')
+            klines = _cached_klines(symbol, '1d', 30)
+        closes = klines['close']
+
+        # La lista può essere vuota se il simbolo non esiste o non ha dati per quell'intervallo/limite
+        if len(closes) < 30:
+            print(f"Dati storici insufficienti o non trovati per {symbol}. Trovati {len(closes)} giorni.")
             # Potresti restituire None o un messaggio più specifico
             return None
 
-        # I dati klines sono una lista di liste. Il prezzo di chiusura è l'elemento con indice 4
-        # Ogni elemento in klines è [ Open time, Open, High, Low, Close, Volume, Close time, ... ]
-        closing_prices = [float(kline[4]) for kline in klines]
-
-        # Calcola la media
-        average_price = sum(closing_prices) / len(closing_prices)
+        # Calcola la media delle ultime 30 chiusure
+        average_price = float(closes[-30:].mean())
 
         return average_price
 
-    except Exception as e:
+    except BINANCE_ERRORS as e:
         # Gestione errori (es. simbolo non valido, problemi di rete/API)
         print(f"Errore in get_binance_average_price_30d per simbolo {symbol}: {e}")
         return None
 
 
-def get_moving_averages(symbol: str, short_period: int, long_period: int) -> tuple[float | None, float | None]:
+def get_moving_averages(symbol: str, short_period: int, long_period: int, klines: np.ndarray | None = None) -> tuple[float | None, float | None]:
     """
     Calcola due medie mobili semplici (SMA) per una criptovaluta da Binance.
 
@@ -82,6 +464,8 @@ def get_moving_averages(symbol: str, short_period: int, long_period: int) -> tup
         symbol: Il simbolo della coppia di trading (es. 'ETHUSDT').
         short_period: Il numero di giorni per la media mobile a breve termine.
         long_period: Il numero di giorni per la media mobile a lungo termine.
+        klines: Opzionale, candele giornaliere già scaricate con _cached_klines (almeno long_period,
+                vengono usate le ultime). Se non fornite vengono scaricate da Binance.
 
     Returns:
         Una tupla contenente (SMA_breve, SMA_lunga), o (None, None) in caso di errore
@@ -93,35 +477,35 @@ def get_moving_averages(symbol: str, short_period: int, long_period: int) -> tup
         return None, None
 
     try:
-        client = Client("", "")
-
-        # Per calcolare sia la media breve che quella lunga, dobbiamo ottenere dati per il periodo più lungo.
-        # Usiamo l'intervallo giornaliero ('1d').
-        # Richiediamo esattamente 'long_period' candele per calcolare la SMA lunga su quel periodo.
-        klines = client.get_klines(symbol=symbol.upper(), interval='1d', limit=long_period) # Usiamo '1d'
+        if klines is None:
+            # Per calcolare sia la media breve che quella lunga, dobbiamo ottenere dati per il periodo più lungo.
+            # Richiediamo esattamente 'long_period' candele giornaliere per calcolare la SMA lunga su quel periodo.
+            klines = _cached_klines(symbol, '1d', long_period)
+        closes = klines['close']
 
         # Controlliamo se abbiamo ricevuto il numero di candele richiesto
-        if not klines or len(klines) < long_period:
-            print(f"Dati storici insufficienti per calcolare SMA {long_period}d per {symbol}. Trovati {len(klines) if klines else 0} giorni.")
+        if len(closes) < long_period:
+            print(f"Dati storici insufficienti per calcolare SMA {long_period}d per {symbol}. Trovati {len(closes)} giorni.")
             return None, None
 
-        # Estraiamo i prezzi di chiusura
-        # Ogni kline è una lista; l'elemento con indice 4 è il prezzo di chiusura.
-        closing_prices = [float(kline[4]) for kline in klines]
+        # Somme cumulative degli ultimi 'long_period' prezzi: con un solo passaggio otteniamo la somma
+        # di qualsiasi coda della serie, quindi entrambe le medie (e altre eventuali) a costo O(1).
+        cumulative = np.cumsum(closes[-long_period:])
+        total = cumulative[-1]
 
-        # Calcola la SMA a lungo termine: media degli ultimi 'long_period' prezzi
-        long_sma = sum(closing_prices) / len(closing_prices)
+        # SMA a lungo termine: media degli ultimi 'long_period' prezzi
+        long_sma = float(total / long_period)
 
-        # Per la SMA a breve termine: prendiamo solo gli ultimi 'short_period' prezzi
-        # Usiamo lo slicing di lista: [inizio:fine]. [-short_period:] prende gli ultimi 'short_period' elementi.
-        short_period_prices = closing_prices[-short_period:]
+        # Periodi uguali: la SMA breve coincide con quella lunga
+        if short_period == long_period:
+            return long_sma, long_sma
 
-        # Calcola la SMA a breve termine
-        short_sma = sum(short_period_prices) / len(short_period_prices)
+        # SMA a breve termine: somma degli ultimi 'short_period' prezzi = totale - somma dei prezzi precedenti
+        short_sma = float((total - cumulative[-short_period - 1]) / short_period)
 
         return short_sma, long_sma
 
-    except Exception as e:
+    except BINANCE_ERRORS as e:
         print(f"Errore nel calcolo delle medie mobili per simbolo {symbol}: {e}")
         return None, None
 
@@ -171,125 +555,188 @@ def generate_crossover_signal(short_ma: float | None, long_ma: float | None, pro
         return "Hold"
 
 
-def generate_breakout_signal(symbol: str, lookback_period: int) -> str:
+def _breakout_levels(klines: np.ndarray) -> tuple[float, float]:
     """
-    Genera un segnale di breakout (Rialzista, Ribassista, Consolidamento)
-    basato sui massimi/minimi degli ultimi N giorni.
+    Trova il prezzo massimo (High) e minimo (Low) nelle candele fornite.
+
+    Args:
+        klines: Le candele già convertite da _parse_klines (almeno una).
+
+    Returns:
+        Una tupla (massimo, minimo) del periodo coperto dalle candele.
+    """
+    return float(klines['high'].max()), float(klines['low'].min())
+
+
+def _closed_klines(klines: np.ndarray, count: int) -> np.ndarray:
+    """
+    Restituisce le ultime 'count' candele chiuse, cioè escludendo l'ultima (quella del giorno in corso).
+
+    I livelli di breakout vanno calcolati su queste: la candela corrente contiene già il prezzo attuale
+    (la sua chiusura parziale non può mai superare il suo High né scendere sotto il suo Low).
+    """
+    return klines[-count - 1:-1]
+
+
+def _classify_breakout(current_price: float, highest_high: float, lowest_low: float) -> str:
+    """
+    Confronta il prezzo attuale con i livelli di resistenza/supporto e restituisce il segnale di breakout.
+    """
+    # Consideriamo un breakout se il prezzo attuale supera strettamente il massimo/minimo del periodo.
+    # N.B.: Nelle strategie reali, spesso si usa un piccolo buffer (%) o si aspetta la chiusura di candela
+    # per filtrare i falsi breakout. Qui usiamo la logica più semplice: superamento netto.
+    if current_price > highest_high:
+        return "Breakout Rialzista"
+    elif current_price < lowest_low:
+        return "Breakout Ribassista"
+    else:
+        # Se non è né sopra il massimo né sotto il minimo, è nel range.
+        return "Consolidamento"
+
+
+@dataclass
+class BreakoutResult:
+    """
+    Risultato dell'analisi di breakout: il segnale e i livelli usati per calcolarlo.
+
+    I livelli e il prezzo sono None se l'analisi non è arrivata a calcolarli (errore o dati insufficienti).
+    """
+    signal: str
+    highest_high: float | None = None
+    lowest_low: float | None = None
+    current_price: float | None = None
+
+
+def analyze_breakout(symbol: str, lookback_period: int, klines: np.ndarray | None = None, use_live_price: bool = False) -> BreakoutResult:
+    """
+    Calcola il segnale di breakout (Rialzista, Ribassista, Consolidamento) confrontando il prezzo attuale
+    con i massimi/minimi degli ultimi N giorni chiusi (esclusa la candela del giorno in corso),
+    restituendo anche i livelli di resistenza/supporto e il prezzo usati.
 
     Args:
         symbol: Il simbolo della coppia di trading (es. 'ETHUSDT').
         lookback_period: Il numero di giorni indietro da considerare per massimi/minimi.
+        klines: Opzionale, candele giornaliere già scaricate con _cached_klines (almeno lookback_period + 1:
+                le ultime lookback_period chiuse più quella corrente). Se non fornite vengono scaricate da Binance.
+        use_live_price: Se True il prezzo attuale viene sempre chiesto a get_binance_price_pb (una richiesta
+                        in più se lo stream WebSocket non è attivo). Di default si usa il prezzo dello stream
+                        se recente, altrimenti la chiusura (parziale) dell'ultima candela: è vecchia al più
+                        KLINES_CACHE_TTL_SECONDS secondi, o KLINES_CACHE_TTL_SECONDS + KLINES_REDIS_TTL_SECONDS
+                        con Redis configurato (una candela letta da Redis resta poi anche nella cache in memoria).
 
     Returns:
-        Una stringa: "Breakout Rialzista", "Breakout Ribassista",
+        Un BreakoutResult. Il campo signal contiene "Breakout Rialzista", "Breakout Ribassista",
         "Consolidamento", o un messaggio di errore/stato.
     """
     # Validazione del lookback period
     if lookback_period <= 0:
-        return "Errore: Il lookback period deve essere positivo."
+        return BreakoutResult("Errore: Il lookback period deve essere positivo.")
 
     try:
-        client = Client("", "")
-
-        # Ottieni le candele giornaliere per il lookback period specificato.
-        # Usiamo l'intervallo giornaliero ('1d').
-        # Il limite ci dà le N candele più recenti.
-        klines = client.get_klines(symbol=symbol.upper(), interval='1d', limit=lookback_period) # Usiamo '1d'
+        if klines is None:
+            # Ottieni le candele giornaliere per il lookback period specificato.
+            # Usiamo l'intervallo giornaliero ('1d').
+            # Il limite ci dà le N candele più recenti: N giorni chiusi più quello in corso.
+            klines = _cached_klines(symbol, '1d', lookback_period + 1) # Usiamo '1d'
 
         # Controlla se abbiamo ricevuto esattamente il numero di candele richiesto
         # Potrebbe esserci meno dati per asset molto nuovi o problemi API
-        if not klines or len(klines) < lookback_period:
-            print(f"Dati storici insufficienti per breakout {lookback_period}d per {symbol}. Trovati {len(klines) if klines else 0} giorni.")
-            return "Dati storici insufficienti per breakout"
-
-        # Trova il prezzo massimo (High) e minimo (Low) nell'intero lookback period
-        # Ogni kline è una lista: [ Open time, Open, High, Low, Close, Volume, Close time, ... ]
-        # L'indice 2 è il prezzo High, l'indice 3 è il prezzo Low.
-        # Inizializziamo con valori appropriati per trovare il vero max/min
-        highest_high = 0.0
-        lowest_low = float('inf') # Inizializziamo con un valore che è sicuramente maggiore di qualsiasi prezzo
-
-        for kline in klines:
-            try:
-                high = float(kline[2])
-                low = float(kline[3])
-
-                if high > highest_high:
-                    highest_high = high
-                if low < lowest_low:
-                    lowest_low = low
-            except (ValueError, IndexError) as e:
-                 print(f"Errore nel parsing di una riga kline: {kline}. Errore: {e}")
-                 # Decidi come gestire kline malformate - qui le saltiamo
-                 continue
-
-
-        # Ottieni il prezzo attuale (usando la funzione esistente)
-        current_price = get_binance_price_pb(symbol)
+        if len(klines) < lookback_period + 1:
+            print(f"Dati storici insufficienti per breakout {lookback_period}d per {symbol}. Trovati {len(klines)} giorni.")
+            return BreakoutResult("Dati storici insufficienti per breakout")
 
-        if current_price is None:
-            return "Errore nel recupero prezzo attuale per breakout"
-
-        # Confronta il prezzo attuale con i livelli di supporto/resistenza trovati.
-        # Consideriamo un breakout se il prezzo attuale supera strettamente il massimo/minimo del periodo.
-        # N.B.: Nelle strategie reali, spesso si usa un piccolo buffer (%) o si aspetta la chiusura di candela
-        # per filtrare i falsi breakout. Qui usiamo la logica più semplice: superamento netto.
+        # Resistenza/supporto dai soli giorni chiusi: il prezzo attuale appartiene alla candela corrente
+        highest_high, lowest_low = _breakout_levels(_closed_klines(klines, lookback_period))
 
-        if current_price > highest_high:
-            return "Breakout Rialzista"
-        elif current_price < lowest_low:
-            return "Breakout Ribassista"
+        if use_live_price:
+            # Prezzo attuale dal ticker (stream WebSocket o richiesta REST)
+            current_price = get_binance_price_pb(symbol)
         else:
-            # Se non è né sopra il massimo né sotto il minimo, è nel range.
-            return "Consolidamento"
+            # L'ultima candela è quella del giorno in corso: la sua chiusura è il prezzo più recente già in mano
+            current_price = _live_price(symbol)
+            if current_price is None:
+                current_price = float(klines['close'][-1])
 
-    except Exception as e:
-        # Cattura altri errori API o inattesi
+        if current_price is None:
+            return BreakoutResult("Errore nel recupero prezzo attuale per breakout", highest_high, lowest_low)
+
+        return BreakoutResult(_classify_breakout(current_price, highest_high, lowest_low), highest_high, lowest_low, current_price)
+
+    except BINANCE_ERRORS as e:
+        # Cattura altri errori API o di dati
         print(f"Errore nel calcolo del segnale di breakout per simbolo {symbol}: {e}")
-        return f"Errore interno nel calcolo breakout."
+        return BreakoutResult("Errore interno nel calcolo breakout.")
+
+
+def generate_breakout_signal(symbol: str, lookback_period: int, klines: np.ndarray | None = None, use_live_price: bool = False) -> str:
+    """
+    Genera un segnale di breakout (Rialzista, Ribassista, Consolidamento)
+    basato sui massimi/minimi degli ultimi N giorni.
+
+    Args:
+        symbol: Il simbolo della coppia di trading (es. 'ETHUSDT').
+        lookback_period: Il numero di giorni indietro da considerare per massimi/minimi.
+        klines: Opzionale, candele giornaliere già scaricate (vedi analyze_breakout).
+        use_live_price: Se True il prezzo attuale viene chiesto a get_binance_price_pb (vedi analyze_breakout).
+
+    Returns:
+        Una stringa: "Breakout Rialzista", "Breakout Ribassista",
+        "Consolidamento", o un messaggio di errore/stato.
+        Per avere anche i livelli calcolati usare analyze_breakout.
+    """
+    return analyze_breakout(symbol, lookback_period, klines, use_live_price).signal
 
 # --- Blocco di test per l'esecuzione diretta del file ---
 if __name__ == "__main__":
     print("--- Test Modulo Binance Lib ---")
 
     # ... (Test per prezzo attuale rimane come prima) ...
-    # ... (Test per media 30gg rimane come prima) ...
-    # ... (Test per medie mobili 20d/50d rimane come prima) ...
 
     print("-" * 20)
 
-    # Nuovo Test SPECIFICO per il segnale di Breakout
-    symbol_breakout_test = "ETHUSDT" # Scegli il simbolo
-    lookback = 20 # Scegli il lookback period (es. ultimi 20 giorni)
-    print(f"Recupero segnale di breakout ({lookback}d) per {symbol_breakout_test}...")
+    # Tutti i test usano le stesse candele: le scarichiamo una sola volta e le passiamo alle funzioni
+    test_symbol = "ETHUSDT" # Scegli il simbolo
+    short_period_test, long_period_test = 20, 50
+    lookback = 20 # Scegli il lookback period del breakout (es. ultimi 20 giorni)
+    max_lookback = max(30, long_period_test, lookback + 1) # Il breakout usa lookback giorni chiusi + quello corrente
 
-    breakout_signal = generate_breakout_signal(symbol_breakout_test, lookback)
-
-    # **Opzionale:** Per rendere il test più informativo, recuperiamo e stampiamo i livelli di max/min trovati.
-    # Notare che stiamo facendo di nuovo la chiamata API solo per scopi di visualizzazione nel test.
+    print(f"Recupero {max_lookback} candele giornaliere per {test_symbol} (una sola chiamata API)...")
     try:
-         client_test = Client("", "")
-         klines_test_info = client_test.get_klines(symbol=symbol_breakout_test.upper(), interval='1d', limit=lookback)
-         if klines_test_info and len(klines_test_info) == lookback:
-            # Troviamo max High e min Low di nuovo per stamparli
-            highest_high_test_info = max(float(k[2]) for k in klines_test_info)
-            lowest_low_test_info = min(float(k[3]) for k in klines_test_info)
-            current_price_test_info = get_binance_price_pb(symbol_breakout_test)
-
-            print(f"  Periodo analizzato: ultimi {lookback} giorni.")
-            print(f"  Massimo (Resistenza) in questo periodo: {highest_high_test_info:.2f}")
-            print(f"  Minimo (Supporto) in questo periodo: {lowest_low_test_info:.2f}")
-            if current_price_test_info is not None:
-                 print(f"  Prezzo attuale: {current_price_test_info:.2f}")
-            else:
-                 print("  Prezzo attuale: Non disponibile.")
-
-         else:
-             print(f"  Impossibile recuperare dati storici ({lookback}d) per mostrare i livelli nel test.")
+        klines_test = _cached_klines(test_symbol, '1d', max_lookback)
+    except BINANCE_ERRORS as e:
+        print(f"  Errore nel recupero delle candele per i test: {e}")
+        klines_test = None
+
+    # Test media 30gg e medie mobili 20d/50d
+    average_30d = get_binance_average_price_30d(test_symbol, klines=klines_test)
+    sma_short, sma_long = get_moving_averages(test_symbol, short_period_test, long_period_test, klines=klines_test)
+
+    print(f"  Prezzo medio 30gg: {f'{average_30d:.2f}' if average_30d is not None else 'Non disponibile.'}")
+    if sma_short is not None and sma_long is not None:
+        print(f"  SMA {short_period_test}d: {sma_short:.2f}, SMA {long_period_test}d: {sma_long:.2f} -> {generate_crossover_signal(sma_short, sma_long)}")
+    else:
+        print(f"  Medie mobili {short_period_test}d/{long_period_test}d: Non disponibili.")
 
-    except Exception as e:
-         print(f"  Errore nel recupero dati per stampa livelli test breakout: {e}")
+    print("-" * 20)
 
+    # Test SPECIFICO per il segnale di Breakout
+    print(f"Recupero segnale di breakout ({lookback}d) per {test_symbol}...")
+
+    breakout = analyze_breakout(test_symbol, lookback, klines=klines_test)
+    breakout_signal = breakout.signal
+
+    # Per rendere il test più informativo stampiamo i livelli di max/min trovati:
+    # sono già nel risultato, non serve nessuna nuova chiamata API.
+    if breakout.highest_high is not None and breakout.lowest_low is not None:
+        print(f"  Periodo analizzato: ultimi {lookback} giorni.")
+        print(f"  Massimo (Resistenza) in questo periodo: {breakout.highest_high:.2f}")
+        print(f"  Minimo (Supporto) in questo periodo: {breakout.lowest_low:.2f}")
+        if breakout.current_price is not None:
+             print(f"  Prezzo attuale: {breakout.current_price:.2f}")
+        else:
+             print("  Prezzo attuale: Non disponibile.")
+    else:
+        print(f"  Impossibile recuperare dati storici ({lookback}d) per mostrare i livelli nel test.")
 
     print(f"\n  Segnale di Breakout ({lookback}d): {breakout_signal}")
 
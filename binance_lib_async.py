@@ -0,0 +1,433 @@
+# File: binance_lib_async.py
+
+# Varianti asincrone delle funzioni di binance_lib.py e bin_lib_adv.py.
+# Le chiamate REST a Binance sono indipendenti tra loro e passano quasi tutto il tempo
+# ad aspettare la rete: con asyncio.gather le lanciamo insieme e il tempo totale diventa
+# quello della chiamata più lenta, invece della somma di tutte.
+# Usiamo httpx direttamente sugli endpoint pubblici REST (nessuna chiave API necessaria):
+# con HTTP/2 tutte le richieste viaggiano multiplexate su un'unica connessione TLS.
+import asyncio
+import json
+import time
+import weakref
+
+import httpx
+import websockets
+
+try:
+    from aiolimiter import AsyncLimiter
+except ImportError: # aiolimiter è opzionale: senza, resta solo il limite di richieste contemporanee
+    AsyncLimiter = None
+
+try:
+    import orjson
+except ImportError: # orjson è opzionale: senza, il JSON delle risposte viene letto con il modulo json
+    orjson = None
+
+# Decodifica del JSON di Binance (le candele sono risposte grandi: orjson è molto più veloce)
+_json_loads = orjson.loads if orjson is not None else json.loads
+
+# I calcoli sui dati sono gli stessi della versione sincrona: li riutilizziamo
+from binance_lib import _breakout_levels, _classify_breakout, _closed_klines, _parse_klines, _used_weight
+from binance_lib import get_moving_averages as _moving_averages_from_klines
+from bin_lib_adv import _volumes_from_klines, generate_volume_signal
+
+BINANCE_BASE_URL = "https://api.binance.com"
+BINANCE_STREAM_URL = "wss://stream.binance.com:9443/stream"
+
+# Attesa massima (secondi) tra un tentativo di riconnessione allo stream e il successivo
+STREAM_MAX_RECONNECT_DELAY_SECONDS = 30.0
+
+# Errori attesi durante le chiamate a Binance (rete, risposte di errore, dati malformati),
+# come binance_lib.BINANCE_ERRORS: le altre eccezioni sono bug e vengono propagate.
+BINANCE_ERRORS = (httpx.HTTPError, ValueError)
+
+# Numero massimo di richieste REST contemporanee verso Binance.
+# Lanciando molte analisi in parallelo si rischiano errori 429 (Too Many Requests):
+# un valore tra 10 e 20 mantiene il parallelismo senza sommergere l'API.
+MAX_CONCURRENT_REQUESTS = 16
+
+# Un semaforo per event loop: asyncio.Semaphore non può essere condiviso tra loop diversi
+# (ogni asyncio.run dei wrapper sincroni ne crea uno nuovo).
+_semaphores: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+# Numero massimo di richieste REST al secondo (token bucket, se aiolimiter è installato).
+# Il semaforo limita le richieste in corso, non la loro frequenza: con risposte rapide anche 16
+# richieste contemporanee possono diventare centinaia al minuto. 20/s restano sotto il limite di
+# peso di Binance anche per le richieste di candele più pesanti, senza arrivare agli errori 429.
+MAX_REQUESTS_PER_SECOND = 20
+
+# Come per i semafori: un limitatore per event loop
+_rate_limiters: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+# Per quanti secondi tenere aperta una connessione inattiva. Il default di httpx (5s) è pensato
+# per raffiche di richieste: con click sporadici sul bot la connessione verrebbe chiusa quasi
+# sempre e ogni richiesta ripeterebbe l'handshake TCP+TLS.
+KEEPALIVE_EXPIRY_SECONDS = 60
+
+
+def create_session() -> httpx.AsyncClient:
+    """
+    Crea la sessione HTTP da passare alle funzioni di questo modulo.
+
+    La sessione va chiusa quando non serve più (es. con "async with create_session() as session:"
+    oppure con "await session.aclose()").
+    """
+    # Con HTTP/2 basta una connessione per molte richieste in parallelo: il pool
+    # serve solo se Binance (o un proxy) risponde in HTTP/1.1
+    return httpx.AsyncClient(
+        base_url=BINANCE_BASE_URL,
+        http2=True,
+        limits=httpx.Limits(
+            max_connections=32,
+            max_keepalive_connections=MAX_CONCURRENT_REQUESTS,
+            keepalive_expiry=KEEPALIVE_EXPIRY_SECONDS,
+        ),
+    )
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    """Restituisce il semaforo delle richieste per l'event loop in esecuzione."""
+    loop = asyncio.get_running_loop()
+    semaphore = _semaphores.get(loop)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+        _semaphores[loop] = semaphore
+    return semaphore
+
+
+def _get_rate_limiter():
+    """Restituisce il limitatore di frequenza per l'event loop in esecuzione, o None senza aiolimiter."""
+    if AsyncLimiter is None:
+        return None
+    loop = asyncio.get_running_loop()
+    limiter = _rate_limiters.get(loop)
+    if limiter is None:
+        limiter = AsyncLimiter(MAX_REQUESTS_PER_SECOND, 1.0)
+        _rate_limiters[loop] = limiter
+    return limiter
+
+
+def _is_transient_error(error: Exception) -> bool:
+    """Indica se un errore di rete/API è temporaneo, cioè se ha senso ripetere la richiesta."""
+    if isinstance(error, httpx.HTTPStatusError):
+        # 429/418: limite di richieste superato; 5xx: problema lato Binance
+        status = error.response.status_code
+        return status in (418, 429) or status >= 500
+    # Errori di trasporto: timeout, connessione rifiutata o interrotta
+    return isinstance(error, httpx.TransportError)
+
+
+async def _retry(coro_factory, tries: int = 4, delay: float = 0.25, backoff: float = 2.0):
+    """
+    Esegue coro_factory() ripetendolo in caso di errori temporanei, con attesa esponenziale
+    (delay, delay*backoff, ...) o con il Retry-After indicato da Binance se più lungo.
+
+    Dopo l'ultimo tentativo (o per errori non temporanei) l'eccezione viene propagata.
+    """
+    wait = delay
+    for attempt in range(1, tries + 1):
+        try:
+            return await coro_factory()
+        except httpx.HTTPError as e:
+            if attempt == tries or not _is_transient_error(e):
+                raise
+            retry_after = None
+            if isinstance(e, httpx.HTTPStatusError):
+                try:
+                    retry_after = float(e.response.headers.get('Retry-After', 0))
+                except ValueError:
+                    retry_after = None
+            sleep_for = max(wait, retry_after or 0.0)
+            print(f"Errore temporaneo nella richiesta a Binance ({e!r}), nuovo tentativo tra {sleep_for:.2f}s...")
+            await asyncio.sleep(sleep_for)
+            wait *= backoff
+
+
+async def _limited(coro):
+    """
+    Esegue la coroutine solo quando ci sono meno di MAX_CONCURRENT_REQUESTS richieste in corso
+    e (con aiolimiter) senza superare MAX_REQUESTS_PER_SECOND.
+    """
+    limiter = _get_rate_limiter()
+    async with _get_semaphore():
+        if limiter is None:
+            return await coro
+        async with limiter:
+            return await coro
+
+
+# --- Chiamate REST di base ---
+
+async def _get_json(session: httpx.AsyncClient, path: str, params: dict) -> list | dict:
+    """Esegue una GET su un endpoint pubblico di Binance e restituisce il JSON della risposta."""
+    # Stesso controllo del peso usato del client sincrono (vedi binance_lib._UsedWeightGauge)
+    delay = _used_weight.delay()
+    if delay > 0:
+        print(f"Limite di peso Binance quasi raggiunto: attendo {delay:.1f}s prima della richiesta.")
+        await asyncio.sleep(delay)
+
+    response = await session.get(f"/api/v3/{path}", params=params)
+    _used_weight.update(response.status_code, response.headers)
+    # Binance restituisce codici HTTP 4xx/5xx in caso di errore (es. simbolo non valido)
+    response.raise_for_status()
+    return _json_loads(response.content)
+
+
+async def get_klines(session: httpx.AsyncClient, symbol: str, interval: str, limit: int) -> list:
+    """
+    Versione asincrona di Client.get_klines: restituisce le ultime 'limit' candele.
+
+    Ogni candela è una lista: [ Open time, Open, High, Low, Close, Volume, Close time, ... ]
+    Gli errori temporanei vengono ritentati, gli altri propagati al chiamante.
+    """
+    params = {"symbol": symbol.upper(), "interval": interval, "limit": limit}
+    return await _retry(lambda: _limited(_get_json(session, "klines", params)))
+
+
+async def get_symbol_ticker(session: httpx.AsyncClient, symbol: str) -> dict:
+    """
+    Versione asincrona di Client.get_symbol_ticker: restituisce {'symbol': '...', 'price': '...'}.
+
+    Gli errori temporanei vengono ritentati, gli altri propagati al chiamante.
+    """
+    params = {"symbol": symbol.upper()}
+    return await _retry(lambda: _limited(_get_json(session, "ticker/price", params)))
+
+
+# --- Stream WebSocket ---
+
+async def stream_prices(symbols: list[str], prices: dict[str, tuple[float, float]]) -> None:
+    """
+    Mantiene aggiornati i prezzi dei simboli con lo stream miniTicker di Binance (un messaggio al secondo).
+
+    Ad ogni messaggio imposta prices['SIMBOLO'] = (ultimo prezzo, time.monotonic() alla ricezione), così chi
+    legge può scartare i prezzi troppo vecchi. Non termina mai: va eseguita come task in background e
+    cancellata quando non serve più. In caso di disconnessione si riconnette con attesa esponenziale.
+    """
+    streams = "/".join(f"{symbol.lower()}@miniTicker" for symbol in symbols)
+    url = f"{BINANCE_STREAM_URL}?streams={streams}"
+    wait = 1.0
+
+    while True:
+        try:
+            async with websockets.connect(url) as ws:
+                wait = 1.0 # Connessione riuscita: azzeriamo l'attesa
+                async for raw_message in ws:
+                    data = _json_loads(raw_message).get('data', {})
+                    if 'c' in data:
+                        prices[data['s']] = (float(data['c']), time.monotonic())
+        except (websockets.WebSocketException, OSError, ValueError) as e:
+            print(f"Stream prezzi Binance interrotto ({e!r}), riconnessione tra {wait:.0f}s...")
+        # Anche la chiusura regolare (Binance chiude le connessioni dopo 24 ore) porta a una riconnessione
+        await asyncio.sleep(wait)
+        wait = min(wait * 2, STREAM_MAX_RECONNECT_DELAY_SECONDS)
+
+
+# --- Funzioni di Analisi ---
+
+async def get_binance_price_pb(session: httpx.AsyncClient, symbol: str) -> float | None:
+    """
+    Recupera il prezzo attuale di una criptovaluta da Binance.
+
+    Args:
+        session: La sessione HTTP creata con create_session.
+        symbol: Il simbolo della coppia di trading (es. 'ETHUSDT').
+
+    Returns:
+        Il prezzo attuale come float, o None se c'è un errore o il simbolo non è valido.
+    """
+    try:
+        ticker = await get_symbol_ticker(session, symbol)
+
+        if ticker and 'price' in ticker:
+            return float(ticker['price'])
+        else:
+            print(f"Risposta API inaspettata per simbolo {symbol}: {ticker}")
+            return None
+
+    except BINANCE_ERRORS as e:
+        print(f"Errore durante il recupero del prezzo (async): {e}")
+        return None
+
+
+async def get_moving_averages(session: httpx.AsyncClient, symbol: str, short_period: int, long_period: int) -> tuple[float | None, float | None]:
+    """
+    Calcola due medie mobili semplici (SMA) come binance_lib.get_moving_averages.
+
+    Args:
+        session: La sessione HTTP creata con create_session.
+        symbol: Il simbolo della coppia di trading (es. 'ETHUSDT').
+        short_period: Il numero di giorni per la media mobile a breve termine.
+        long_period: Il numero di giorni per la media mobile a lungo termine.
+
+    Returns:
+        Una tupla contenente (SMA_breve, SMA_lunga), o (None, None) in caso di errore
+        o dati insufficienti.
+    """
+    if short_period <= 0 or long_period <= 0 or short_period > long_period:
+        print("Errore: i periodi delle medie mobili devono essere positivi e il periodo breve <= periodo lungo.")
+        return None, None
+
+    try:
+        klines = _parse_klines(await get_klines(session, symbol, '1d', long_period))
+    except BINANCE_ERRORS as e:
+        print(f"Errore nel calcolo delle medie mobili (async) per simbolo {symbol}: {e}")
+        return None, None
+
+    # Il calcolo sulle candele è quello della versione sincrona
+    return _moving_averages_from_klines(symbol, short_period, long_period, klines)
+
+
+async def generate_breakout_signal(session: httpx.AsyncClient, symbol: str, lookback_period: int, use_live_price: bool = False) -> str:
+    """
+    Genera un segnale di breakout come binance_lib.generate_breakout_signal.
+
+    Di default il prezzo attuale è la chiusura (parziale) dell'ultima candela, quindi basta una richiesta;
+    con use_live_price=True il prezzo viene chiesto al ticker, in parallelo alle candele.
+    I livelli di breakout sono calcolati sulle lookback_period candele chiuse che precedono quella corrente.
+
+    Args:
+        session: La sessione HTTP creata con create_session.
+        symbol: Il simbolo della coppia di trading (es. 'ETHUSDT').
+        lookback_period: Il numero di giorni indietro da considerare per massimi/minimi.
+        use_live_price: Se True il prezzo attuale viene chiesto a get_binance_price_pb.
+
+    Returns:
+        Una stringa: "Breakout Rialzista", "Breakout Ribassista",
+        "Consolidamento", o un messaggio di errore/stato.
+    """
+    if lookback_period <= 0:
+        return "Errore: Il lookback period deve essere positivo."
+
+    try:
+        if use_live_price:
+            # Candele e prezzo non dipendono l'uno dall'altro: li chiediamo insieme
+            raw_klines, current_price = await asyncio.gather(
+                get_klines(session, symbol, '1d', lookback_period + 1),
+                get_binance_price_pb(session, symbol),
+            )
+            klines = _parse_klines(raw_klines)
+        else:
+            klines = _parse_klines(await get_klines(session, symbol, '1d', lookback_period + 1))
+            current_price = float(klines['close'][-1]) if len(klines) else None
+
+        if len(klines) < lookback_period + 1:
+            print(f"Dati storici insufficienti per breakout {lookback_period}d per {symbol}. Trovati {len(klines)} giorni.")
+            return "Dati storici insufficienti per breakout"
+
+        if current_price is None:
+            return "Errore nel recupero prezzo attuale per breakout"
+
+        highest_high, lowest_low = _breakout_levels(_closed_klines(klines, lookback_period))
+        return _classify_breakout(current_price, highest_high, lowest_low)
+
+    except BINANCE_ERRORS as e:
+        print(f"Errore nel calcolo del segnale di breakout (async) per simbolo {symbol}: {e}")
+        return "Errore interno nel calcolo breakout."
+
+
+async def analyze_symbol(session: httpx.AsyncClient, symbol: str, lookback_period: int) -> dict:
+    """
+    Esegue in un solo passaggio l'analisi prezzo + breakout + volume di un simbolo.
+
+    Viene fatta una sola richiesta di candele (lookback_period+1 giorni, sufficienti sia per il
+    breakout sia per il volume medio) in parallelo alla richiesta del prezzo attuale.
+
+    Args:
+        session: La sessione HTTP creata con create_session.
+        symbol: Il simbolo della coppia di trading (es. 'ETHUSDT').
+        lookback_period: Il numero di giorni per breakout e volume medio.
+
+    Returns:
+        Un dizionario con le chiavi 'price', 'breakout_signal', 'current_volume',
+        'avg_volume' e 'volume_signal'. I valori non disponibili sono None.
+    """
+    result = {
+        'price': None,
+        'breakout_signal': "Errore interno nel calcolo breakout.",
+        'current_volume': None,
+        'avg_volume': None,
+        'volume_signal': "Dati Volume non disponibili",
+    }
+
+    if lookback_period <= 0:
+        print("Errore: Il lookback period deve essere positivo.")
+        result['breakout_signal'] = "Errore: Il lookback period deve essere positivo."
+        return result
+
+    try:
+        raw_klines, current_price = await asyncio.gather(
+            get_klines(session, symbol, '1d', lookback_period + 1),
+            get_binance_price_pb(session, symbol),
+        )
+        klines = _parse_klines(raw_klines)
+    except BINANCE_ERRORS as e:
+        print(f"Errore nell'analisi (async) di {symbol}: {e}")
+        return result
+
+    result['price'] = current_price
+
+    # Breakout: le 'lookback_period' candele chiuse che precedono quella corrente
+    breakout_klines = _closed_klines(klines, lookback_period)
+    if len(breakout_klines) < lookback_period:
+        result['breakout_signal'] = "Dati storici insufficienti per breakout"
+    elif current_price is None:
+        result['breakout_signal'] = "Errore nel recupero prezzo attuale per breakout"
+    else:
+        highest_high, lowest_low = _breakout_levels(breakout_klines)
+        result['breakout_signal'] = _classify_breakout(current_price, highest_high, lowest_low)
+
+    # Volume: candela corrente + 'lookback_period' candele chiuse
+    current_volume, avg_volume = _volumes_from_klines(symbol, klines, lookback_period)
+    result['current_volume'] = current_volume
+    result['avg_volume'] = avg_volume
+    result['volume_signal'] = generate_volume_signal(current_volume, avg_volume)
+
+    return result
+
+
+# --- Wrapper sincroni per i chiamanti esistenti ---
+
+def analyze_symbol_sync(symbol: str, lookback_period: int) -> dict:
+    """Versione bloccante di analyze_symbol (crea e chiude una sessione dedicata)."""
+    async def _run() -> dict:
+        async with create_session() as session:
+            return await analyze_symbol(session, symbol, lookback_period)
+
+    return asyncio.run(_run())
+
+
+def generate_breakout_signal_sync(symbol: str, lookback_period: int, use_live_price: bool = False) -> str:
+    """Versione bloccante di generate_breakout_signal (crea e chiude una sessione dedicata)."""
+    async def _run() -> str:
+        async with create_session() as session:
+            return await generate_breakout_signal(session, symbol, lookback_period, use_live_price)
+
+    return asyncio.run(_run())
+
+
+# --- Blocco di test per l'esecuzione diretta del file ---
+if __name__ == "__main__":
+    print("--- Test Modulo Binance Lib Async ---")
+
+    test_symbol = "ETHUSDT"
+    lookback = 20
+    print(f"Analisi completa ({lookback}d) per {test_symbol} con richieste parallele...")
+
+    analysis = analyze_symbol_sync(test_symbol, lookback)
+
+    if analysis['price'] is not None:
+        print(f"  Prezzo attuale: {analysis['price']:.2f}")
+    else:
+        print("  Prezzo attuale: Non disponibile.")
+    print(f"  Segnale di Breakout ({lookback}d): {analysis['breakout_signal']}")
+    volume_oggi = analysis['current_volume']
+    volume_medio = analysis['avg_volume']
+    if volume_oggi is not None:
+        print(f"  Volume scambiato oggi (finora): {f'{volume_oggi:,.2f}'.replace(',', '˙')}")
+    if volume_medio is not None:
+        print(f"  Volume medio ultimi {lookback} giorni: {f'{volume_medio:,.2f}'.replace(',', '˙')}")
+    print(f"  Segnale Volume: {analysis['volume_signal']}")
+
+    print("-" * 20)
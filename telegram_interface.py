@@ -1,23 +1,55 @@
 # File: telegram_interface.py
 
+import asyncio
 import logging
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
+import re
+import time
+from typing import Any, Awaitable, Callable
+from telegram import CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram.constants import ChatAction, ParseMode
+from telegram.error import BadRequest, TelegramError
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes
-import asyncio # Importa asyncio
+from telegram.request import HTTPXRequest
 import telegram_api_code as tapic
 
-# Importa le funzioni necessarie dal tuo file di utilità Binance
-# Assicurati che binance_lib.py sia nella stessa directory
-from binance_lib import ( # <-- Importa le funzioni specifiche
+# uvloop è opzionale: se installato sostituisce l'event loop standard di asyncio con uno più veloce (libuv)
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+# orjson è opzionale: se installato decodifica le risposte del Bot API al posto del modulo json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Importa le funzioni necessarie dai tuoi file di utilità Binance
+# Assicurati che binance_lib.py e binance_lib_async.py siano nella stessa directory
+# Le chiamate di rete sono asincrone: vengono attese direttamente negli handler, senza thread
+from binance_lib import generate_crossover_signal
+from binance_lib_async import ( # <-- Importa le funzioni specifiche
+    create_session,
     get_binance_price_pb,
     get_moving_averages,
-    generate_crossover_signal,
-    generate_breakout_signal
+    generate_breakout_signal,
+    stream_prices
 )
 
 # SOSTITUISCI CON IL TUO TOKEN DEL BOT
 BOT_TOKEN = tapic.API_CODE
 
+# --- Webhook (opzionale) ---
+# Se in telegram_api_code.py è definito WEBHOOK_HOST (es. "bot.example.com"), Telegram invia gli update
+# a https://WEBHOOK_HOST/<token> invece di essere interrogato in polling. Il TLS va terminato da un
+# reverse proxy davanti alla porta WEBHOOK_PORT, oppure indicando WEBHOOK_CERT/WEBHOOK_KEY.
+# WEBHOOK_SECRET (solo A-Z, a-z, 0-9, _ e -) permette di scartare le richieste che non arrivano da Telegram.
+WEBHOOK_HOST = getattr(tapic, "WEBHOOK_HOST", None)
+WEBHOOK_PORT = getattr(tapic, "WEBHOOK_PORT", 8443)
+WEBHOOK_SECRET = getattr(tapic, "WEBHOOK_SECRET", None)
+WEBHOOK_CERT = getattr(tapic, "WEBHOOK_CERT", None)
+WEBHOOK_KEY = getattr(tapic, "WEBHOOK_KEY", None)
+
 # Configura il logging
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO
@@ -36,152 +68,347 @@ MA_PROXIMITY_THRESHOLD_PERCENT = 0.5
 # Parametri per Breakout
 BREAKOUT_LOOKBACK_PERIOD = 20
 
+# --- Tastiera inline ---
+# CRYPTO_SYMBOL è fisso: callback_data e tastiera vengono costruiti una sola volta all'import
+CB_PRICE = f"get_price_{CRYPTO_SYMBOL}"
+CB_MA = f"get_ma_signal_{CRYPTO_SYMBOL}"
+CB_BREAKOUT = f"get_breakout_signal_{CRYPTO_SYMBOL}"
+
+# Pattern dei CallbackQueryHandler, compilati una volta sola (corrispondenza esatta)
+_CB_PRICE_RE = re.compile(f"^{re.escape(CB_PRICE)}$")
+_CB_MA_RE = re.compile(f"^{re.escape(CB_MA)}$")
+_CB_BREAKOUT_RE = re.compile(f"^{re.escape(CB_BREAKOUT)}$")
+
+# Ogni pulsante ha un testo visibile e una callback_data univoca
+_REPLY_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton(f"{CRYPTO_SYMBOL} Info (Prezzo)", callback_data=CB_PRICE)],
+    [InlineKeyboardButton("Segnale Moving AVG", callback_data=CB_MA)],
+    [InlineKeyboardButton("Segnale Breakout", callback_data=CB_BREAKOUT)],
+])
+
+# --- MarkdownV2 ---
+# Caratteri riservati di MarkdownV2: nel testo normale vanno sempre preceduti da \
+_MD_ESCAPE_RE = re.compile(r"([_*\[\]()~`>#+\-=|{}.!\\])")
+# Marcatori di formattazione MarkdownV2 (o caratteri escapati con \): vedi _strip_md
+_MD_TOKEN_RE = re.compile(r"\\(.)|[*_~|`]")
+
+def _escape_md(text: str) -> str:
+    """Escapa i caratteri riservati di MarkdownV2, così il testo viene mostrato così com'è."""
+    return _MD_ESCAPE_RE.sub(r"\\\1", text)
+
+def _strip_md(text: str) -> str:
+    """Restituisce il testo come lo mostra Telegram dopo il parsing MarkdownV2 (senza marcatori ed escape)."""
+    return _MD_TOKEN_RE.sub(lambda match: match.group(1) or "", text).strip()
+
+# --- Testi delle risposte ---
+# Le parti fisse (simbolo, periodi, etichette) sono note all'import: i modelli vengono composti ed escapati
+# per MarkdownV2 una sola volta. I segnaposto vanno riempiti con valori già passati da _escape_md.
+PRICE_TEMPLATE = _escape_md(f"📈 Prezzo attuale di {CRYPTO_SYMBOL} su Binance: ") + "{price}"
+PRICE_ERROR_TEXT = _escape_md(f"❌ Non è stato possibile ottenere il prezzo per {CRYPTO_SYMBOL}.")
+
+MA_TEMPLATE = (
+    _escape_md(f"📊 Segnale Moving Average ({SHORT_MA_PERIOD}d/{LONG_MA_PERIOD}d) per {CRYPTO_SYMBOL}:\n  Segnale: ")
+    + "*{signal}*" # Usiamo il grassetto per il segnale
+    + _escape_md(f"\n  (SMA {SHORT_MA_PERIOD}d: ") + "{short_ma}"
+    + _escape_md(f", SMA {LONG_MA_PERIOD}d: ") + "{long_ma}" + _escape_md(")")
+)
+MA_ERROR_TEMPLATE = _escape_md(f"⚠️ Impossibile calcolare il segnale MA per {CRYPTO_SYMBOL}. ") + "{signal}" + _escape_md(".")
+
+BREAKOUT_TEMPLATE = (
+    _escape_md(f"💥 Segnale Breakout ({BREAKOUT_LOOKBACK_PERIOD}d) per {CRYPTO_SYMBOL}:\n  Segnale: ")
+    + "*{signal}*" # Usiamo il grassetto
+)
+BREAKOUT_ERROR_TEMPLATE = _escape_md(f"⚠️ Impossibile calcolare il segnale Breakout per {CRYPTO_SYMBOL}. ") + "{signal}" + _escape_md(".")
+
+# --- Stream dei prezzi ---
+# Prezzi ricevuti dallo stream WebSocket avviato in post_init: se l'ultimo è più vecchio di così si torna alla richiesta REST
+PRICE_STREAM_MAX_AGE_SECONDS = 5
+
+# --- Cache dei risultati (secondi di validità) ---
+# Le medie e il breakout su candele giornaliere cambiano lentamente: più click ravvicinati
+# riusano lo stesso risultato invece di ripetere le richieste a Binance.
+PRICE_CACHE_TTL_SECONDS = 2
+MA_CACHE_TTL_SECONDS = 30
+BREAKOUT_CACHE_TTL_SECONDS = 30
+
+# chiave -> (istante di scadenza su time.monotonic(), risultato)
+_results_cache: dict[str, tuple[float, Any]] = {}
+# chiave -> richiesta in corso: i click che arrivano mentre il risultato non è ancora pronto la attendono
+_pending_results: dict[str, asyncio.Task] = {}
+
+async def cached(key: str, ttl: float, coro_factory: Callable[[], Awaitable[Any]], cache_if: Callable[[Any], bool] = lambda result: result is not None) -> Any:
+    """
+    Restituisce il risultato in cache per 'key' se ancora valido, altrimenti esegue coro_factory()
+    e lo memorizza per 'ttl' secondi (solo se cache_if(risultato) è vero, così gli errori non restano in cache).
+
+    Le chiamate contemporanee con la stessa chiave condividono un'unica esecuzione di coro_factory().
+    """
+    entry = _results_cache.get(key)
+    if entry is not None and entry[0] > time.monotonic():
+        return entry[1]
+
+    task = _pending_results.get(key)
+    if task is None:
+        task = asyncio.ensure_future(coro_factory())
+        _pending_results[key] = task
+
+        def store_result(done: asyncio.Task) -> None:
+            # Conclusa la richiesta, la chiave non è più "in corso": in cache solo i risultati validi
+            _pending_results.pop(key, None)
+            if not done.cancelled() and done.exception() is None and cache_if(done.result()):
+                _results_cache[key] = (time.monotonic() + ttl, done.result())
+
+        task.add_done_callback(store_result)
+
+    # shield: se un click viene annullato, la richiesta condivisa continua per gli altri
+    return await asyncio.shield(task)
+
 # --- Handlers ---
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Invia un messaggio di benvenuto con i tre pulsanti inline."""
-    # Definisci la tastiera inline con i tre pulsanti
-    # Ogni pulsante ha un testo visibile e una callback_data univoca
-    keyboard = [
-        [
-            InlineKeyboardButton(f"{CRYPTO_SYMBOL} Info (Prezzo)", callback_data=f"get_price_{CRYPTO_SYMBOL}"),
-        ],
-        [
-            InlineKeyboardButton("Segnale Moving AVG", callback_data=f"get_ma_signal_{CRYPTO_SYMBOL}"),
-        ],
-        [
-            InlineKeyboardButton("Segnale Breakout", callback_data=f"get_breakout_signal_{CRYPTO_SYMBOL}"),
-        ],
-    ]
-
-    # Crea l'oggetto InlineKeyboardMarkup
-    reply_markup = InlineKeyboardMarkup(keyboard)
-
-    # Invia il messaggio con la tastiera
+    # Invia il messaggio con la tastiera (costruita una volta sola, vedi _REPLY_MARKUP)
     await update.message.reply_text(
         "Seleziona l'informazione che desideri su " + CRYPTO_SYMBOL + ":",
-        reply_markup=reply_markup # Allega la tastiera
+        reply_markup=_REPLY_MARKUP # Allega la tastiera
     )
 
-async def handle_button_click(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Gestisce il click sui pulsanti inline e fornisce l'informazione specifica."""
-    query = update.callback_query
-    await query.answer()
+# 1. Pulsante "ETH Info" -> Prezzo attuale
+async def _handle_price(query: CallbackQuery, context: ContextTypes.DEFAULT_TYPE) -> str:
+    """Restituisce il messaggio con il prezzo attuale di CRYPTO_SYMBOL."""
+    # Sessione HTTP verso Binance condivisa da tutti gli handler (creata in post_init)
+    session = context.bot_data["session"]
+
+    # Prezzo dallo stream in background: una lettura dal dizionario, se è recente
+    price = None
+    streamed = context.bot_data["prices"].get(CRYPTO_SYMBOL)
+    if streamed is not None and time.monotonic() - streamed[1] <= PRICE_STREAM_MAX_AGE_SECONDS:
+        price = streamed[0]
+    else:
+        # Stream non ancora connesso o interrotto: usiamo la funzione asincrona del tuo modulo
+        price = await cached(
+            f"price:{CRYPTO_SYMBOL}", PRICE_CACHE_TTL_SECONDS,
+            lambda: get_binance_price_pb(session, CRYPTO_SYMBOL),
+        )
+
+    # Prepara il messaggio dal modello (MarkdownV2: i valori vengono escapati)
+    if price is not None:
+        return PRICE_TEMPLATE.format(price=_escape_md(str(price)))
+    return PRICE_ERROR_TEXT
+
+# 2. Pulsante "Moving AVG" -> Segnale Crossover
+async def _handle_ma(query: CallbackQuery, context: ContextTypes.DEFAULT_TYPE) -> str:
+    """Restituisce il messaggio con il segnale di crossover delle medie mobili."""
+    session = context.bot_data["session"]
+
+    # Recupera le medie mobili usando la funzione asincrona
+    # Solo se il risultato non è in cache si va in rete: intanto mostriamo "sta scrivendo..."
+    async def fetch_moving_averages() -> tuple[float | None, float | None]:
+        mas, _ = await asyncio.gather(
+            get_moving_averages(session, CRYPTO_SYMBOL, SHORT_MA_PERIOD, LONG_MA_PERIOD),
+            _send_typing(query, context),
+        )
+        return mas
 
-    callback_data = query.data
-    logger.info(f"Ricevuta callback_data: {callback_data}")
+    short_ma, long_ma = await cached(
+        f"ma:{CRYPTO_SYMBOL}:{SHORT_MA_PERIOD}:{LONG_MA_PERIOD}", MA_CACHE_TTL_SECONDS,
+        fetch_moving_averages,
+        cache_if=lambda mas: mas[0] is not None and mas[1] is not None,
+    )
 
-    # Inizializza il messaggio di risposta
-    message_text = "..." # Messaggio di fallback
+    # Genera il segnale crossover
+    signal = generate_crossover_signal(short_ma, long_ma, MA_PROXIMITY_THRESHOLD_PERCENT)
 
-    # --- Ottieni l'evento loop corrente ---
-    loop = asyncio.get_event_loop() # <-- AGGIUNTO QUI
+    # Prepara il messaggio dal modello (MarkdownV2: i valori vengono escapati)
+    # Controlla sia l'errore dati non disponibili che non validi; senza medie valide non c'è nulla da stampare
+    if signal.startswith("Dati MA non") or short_ma is None or long_ma is None:
+        return MA_ERROR_TEMPLATE.format(signal=_escape_md(signal))
 
-    # --- Logica basata sul callback_data ---
+    return MA_TEMPLATE.format(
+        signal=_escape_md(signal),
+        short_ma=_escape_md(f"{short_ma:.2f}"),
+        long_ma=_escape_md(f"{long_ma:.2f}"),
+    )
 
-    # 1. Pulsante "ETH Info" -> Prezzo attuale
-    if callback_data == f"get_price_{CRYPTO_SYMBOL}":
-        # Recupera il prezzo usando la funzione dal tuo modulo, eseguendola in un thread separato
-        # Ora usiamo il 'loop' ottenuto prima
-        price = await loop.run_in_executor( # <-- MODIFICATO QUI
-            None, get_binance_price_pb, CRYPTO_SYMBOL
-        )
+# 3. Pulsante "Breakout Analysis" -> Segnale Breakout
+async def _handle_breakout(query: CallbackQuery, context: ContextTypes.DEFAULT_TYPE) -> str:
+    """Restituisce il messaggio con il segnale di breakout."""
+    session = context.bot_data["session"]
 
-        # Prepara il messaggio
-        if price is not None:
-            message_text = f"📈 Prezzo attuale di {CRYPTO_SYMBOL} su Binance: {price}"
-        else:
-            message_text = f"❌ Non è stato possibile ottenere il prezzo per {CRYPTO_SYMBOL}."
-
-    # 2. Pulsante "Moving AVG" -> Segnale Crossover
-    elif callback_data == f"get_ma_signal_{CRYPTO_SYMBOL}":
-        # Recupera le medie mobili usando la funzione, eseguendola in un thread separato
-        # Usiamo il 'loop' ottenuto prima
-        short_ma, long_ma = await loop.run_in_executor( # <-- MODIFICATO QUI
-            None, get_moving_averages, CRYPTO_SYMBOL, SHORT_MA_PERIOD, LONG_MA_PERIOD
-        )
+    # Genera il segnale breakout usando la funzione asincrona
+    signal = await cached(
+        f"breakout:{CRYPTO_SYMBOL}:{BREAKOUT_LOOKBACK_PERIOD}", BREAKOUT_CACHE_TTL_SECONDS,
+        lambda: generate_breakout_signal(session, CRYPTO_SYMBOL, BREAKOUT_LOOKBACK_PERIOD),
+        cache_if=lambda result: not result.startswith(("Errore", "Dati")),
+    )
+
+    # Prepara il messaggio dal modello (MarkdownV2: i valori vengono escapati)
+    if signal.startswith("Errore") or signal == "Dati storici insufficienti per breakout":
+        return BREAKOUT_ERROR_TEMPLATE.format(signal=_escape_md(signal))
+    return BREAKOUT_TEMPLATE.format(signal=_escape_md(signal))
+
+async def _answer_query(query: CallbackQuery) -> None:
+    """Conferma a Telegram la ricezione del click (toglie l'attesa dal pulsante; errori solo loggati)."""
+    try:
+        await query.answer()
+    except TelegramError as e:
+        logger.warning(f"Impossibile rispondere alla callback: {e}")
+
+async def _send_typing(query: CallbackQuery, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Mostra "sta scrivendo..." nella chat mentre la risposta viene preparata (errori solo loggati).
+
+    Telegram toglie l'indicazione solo all'invio di un nuovo messaggio (non alla modifica) o dopo 5 secondi:
+    va usata solo per attese reali, non per le risposte già in memoria.
+    """
+    try:
+        await context.bot.send_chat_action(chat_id=query.message.chat_id, action=ChatAction.TYPING)
+    except TelegramError as e:
+        logger.warning(f"Impossibile inviare l'azione 'typing': {e}")
+
+async def _answer_button(update: Update, context: ContextTypes.DEFAULT_TYPE, build_text: Callable[..., Awaitable[str]]) -> None:
+    """Risponde al click su un pulsante inline con il testo (già in MarkdownV2) preparato da build_text."""
+    query = update.callback_query
+    logger.info(f"Ricevuta callback_data: {query.data}")
+
+    # Risposta alla callback e richieste a Binance partono insieme:
+    # la chiamata a Telegram non ritarda quelle a Binance (tempo totale = la più lenta)
+    message_text, _ = await asyncio.gather(build_text(query, context), _answer_query(query))
+
+    # Stesso testo e stessa tastiera (es. click ripetuto con risultato in cache): Telegram risponderebbe
+    # "Message is not modified", quindi evitiamo la richiesta
+    if query.message.text == _strip_md(message_text) and query.message.reply_markup == _REPLY_MARKUP:
+        logger.info("Messaggio invariato, modifica non necessaria.")
+        return
 
-        # Genera il segnale crossover
-        signal = generate_crossover_signal(short_ma, long_ma, MA_PROXIMITY_THRESHOLD_PERCENT)
-
-        # Prepara il messaggio
-        if signal.startswith("Dati MA non"): # Controlla sia l'errore dati non disponibili che non validi
-             message_text = f"⚠️ Impossibile calcolare il segnale MA per {CRYPTO_SYMBOL}. {signal}."
-        else:
-             # Assicurati che i valori delle medie siano validi prima di stamparli
-             ma_values_text = ""
-             if short_ma is not None and long_ma is not None:
-                  ma_values_text = f"\n  (SMA {SHORT_MA_PERIOD}d: {short_ma:.2f}, SMA {LONG_MA_PERIOD}d: {long_ma:.2f})"
-
-             message_text = (
-                f"📊 Segnale Moving Average ({SHORT_MA_PERIOD}d/{LONG_MA_PERIOD}d) per {CRYPTO_SYMBOL}:\n"
-                f"  Segnale: **{signal}**" # Usiamo il grassetto per il segnale
-                f"{ma_values_text}" # Aggiungi i valori solo se disponibili
-             )
-
-
-    # 3. Pulsante "Breakout Analysis" -> Segnale Breakout
-    elif callback_data == f"get_breakout_signal_{CRYPTO_SYMBOL}":
-         # Genera il segnale breakout, eseguendo la funzione in un thread separato
-         # Usiamo il 'loop' ottenuto prima
-         signal = await loop.run_in_executor( # <-- MODIFICATO QUI
-             None, generate_breakout_signal, CRYPTO_SYMBOL, BREAKOUT_LOOKBACK_PERIOD
-         )
-
-         # Prepara il messaggio
-         if signal.startswith("Errore") or signal == "Dati storici insufficienti per breakout":
-              message_text = f"⚠️ Impossibile calcolare il segnale Breakout per {CRYPTO_SYMBOL}. {signal}."
-         else:
-              message_text = (
-                f"💥 Segnale Breakout ({BREAKOUT_LOOKBACK_PERIOD}d) per {CRYPTO_SYMBOL}:\n"
-                f"  Segnale: **{signal}**" # Usiamo il grassetto
-              )
-
-
-    # Modifica il messaggio originale (quello con i pulsanti) con la risposta specifica
-    # ATTENZIONE: MarkdownV2 richiede l'escaping di certi caratteri se non fanno parte della sintassi Markdown.
-    # Esempi: _ * [ ] ( ) ~ ` > # + - = | { } . ! \
-    # Se i tuoi simboli crypto o numeri contengono questi caratteri, dovresti gestirli.
-    # Per i simboli tipo "ETHUSDT" e numeri float, di solito non ci sono problemi.
-    # Il problema maggiore sono . e ! nei numeri o testi liberi.
-    # Se riscontri errori di parsing Markdown, la soluzione più semplice è rimuovere parse_mode='MarkdownV2'.
+    # Modifica il messaggio originale (quello con i pulsanti) con la risposta specifica.
+    # Il testo è già escapato per MarkdownV2 (vedi _escape_md), quindi non ci sono errori di parsing.
     try:
         await query.edit_message_text(
             text=message_text,
-            reply_markup=query.message.reply_markup, # Mantiene la tastiera
-            parse_mode='MarkdownV2' # Permette grassetto/emoji
+            # Senza reply_markup Telegram toglierebbe la tastiera dal messaggio: inviamo sempre lo stesso
+            # oggetto costruito all'import (nessuna copia di query.message.reply_markup ad ogni modifica)
+            reply_markup=_REPLY_MARKUP, # Mantiene la tastiera
+            parse_mode=ParseMode.MARKDOWN_V2 # Permette grassetto/emoji
         )
-    except Exception as e:
-        # Gestisci errori di editing, es. messaggio non modificabile o errori Markdown
-        logger.error(f"Errore nell'editare il messaggio: {e}. Messaggio originale:\n{message_text}")
-        # Riprova inviando un nuovo messaggio senza formattazione Markdown
+    except BadRequest as e:
+        # Messaggio già identico (es. modificato nel frattempo da un altro click): nulla da fare
+        if "not modified" in e.message.lower():
+            return
+        # Altri errori di editing, es. messaggio non più modificabile: inviamo la risposta come nuovo messaggio.
+        # Gli errori di rete non vengono intercettati qui: li gestisce (e li logga) PTB.
+        logger.warning(f"Errore nell'editare il messaggio: {e}. Messaggio originale:\n{message_text}")
+        await query.message.reply_text(text=_strip_md(message_text))
+
+# Un handler per pulsante: è PTB a scegliere quello giusto confrontando callback_data con il pattern
+async def price_button(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Pulsante "Info (Prezzo)"."""
+    await _answer_button(update, context, _handle_price)
+
+async def ma_button(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Pulsante "Segnale Moving AVG"."""
+    await _answer_button(update, context, _handle_ma)
+
+async def breakout_button(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Pulsante "Segnale Breakout"."""
+    await _answer_button(update, context, _handle_breakout)
+
+# --- Richieste al Bot API di Telegram ---
+
+# Il Bot API supporta HTTP/2: sendMessage, editMessageText, answerCallbackQuery, ... di utenti diversi
+# viaggiano multiplexate sulla stessa connessione invece di accodarsi. Il pool, fissato esplicitamente
+# (i default cambiano tra le versioni di PTB), serve per le richieste contemporanee degli handler.
+TELEGRAM_HTTP_VERSION = "2"
+TELEGRAM_CONNECTION_POOL_SIZE = 256
+
+class OrjsonHTTPXRequest(HTTPXRequest):
+    """HTTPXRequest che decodifica le risposte di Telegram (update compresi) con orjson."""
+
+    @staticmethod
+    def parse_json_payload(payload: bytes) -> dict:
         try:
-            await query.message.reply_text(text=message_text)
-        except Exception as e_reply:
-             logger.error(f"Errore nell'inviare messaggio di fallback: {e_reply}")
-             # Ultima risorsa: invia un messaggio di errore semplice
-             await query.message.reply_text("Si è verificato un errore interno nel bot.")
+            return orjson.loads(payload)
+        except orjson.JSONDecodeError as exc:
+            logger.exception(f"Impossibile decodificare il JSON ricevuto da Telegram: {payload!r}")
+            raise TelegramError("Invalid server response") from exc
+
+def _build_request(**kwargs) -> HTTPXRequest:
+    """Crea il client HTTP per il Bot API, in HTTP/2 (con orjson se disponibile)."""
+    request_class = OrjsonHTTPXRequest if orjson is not None else HTTPXRequest
+    return request_class(http_version=TELEGRAM_HTTP_VERSION, **kwargs)
+
+# --- Ciclo di vita della sessione HTTP verso Binance ---
+
+async def post_init(application: Application) -> None:
+    """Crea la sessione HTTP verso Binance e avvia lo stream dei prezzi, una sola volta all'avvio del bot."""
+    application.bot_data["session"] = create_session()
+    # Simbolo -> (prezzo, istante di ricezione), aggiornato in background da stream_prices.
+    # Task asyncio nostro (non application.create_task, che all'arresto verrebbe atteso senza fine).
+    application.bot_data["prices"] = {}
+    application.bot_data["price_stream"] = asyncio.create_task(
+        stream_prices([CRYPTO_SYMBOL], application.bot_data["prices"])
+    )
+
+async def post_shutdown(application: Application) -> None:
+    """Ferma lo stream dei prezzi e chiude la sessione HTTP verso Binance all'arresto del bot."""
+    price_stream = application.bot_data.pop("price_stream", None)
+    if price_stream is not None:
+        price_stream.cancel()
+        try:
+            await price_stream
+        except asyncio.CancelledError:
+            pass
+
+    session = application.bot_data.pop("session", None)
+    if session is not None:
+        await session.aclose()
 
 # --- Funzione Principale per Avviare il Bot ---
 
 def main() -> None:
     """Avvia il bot."""
+    # Va impostato prima che PTB crei l'event loop in run_polling/run_webhook
+    if uvloop is not None:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+        logger.info("Event loop: uvloop")
+
     # Costruisci l'applicazione del bot
-    application = Application.builder().token(BOT_TOKEN).build()
+    application = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .request(_build_request(connection_pool_size=TELEGRAM_CONNECTION_POOL_SIZE)) # Chiamate del bot (sendMessage, editMessageText, ...)
+        .get_updates_request(_build_request()) # getUpdates (polling) usa un client separato: una sola richiesta alla volta
+        .post_init(post_init) # Sessione Binance creata nell'event loop del bot
+        .post_shutdown(post_shutdown)
+        .build()
+    )
 
     # Aggiungi gli handlers
     # Handler per il comando /start
     application.add_handler(CommandHandler("start", start))
 
-    # Handler per i click sui pulsanti inline
-    # Il pattern "^get_" cattura callback_data che iniziano con "get_"
-    # Se aggiungerai altri callback_data che iniziano con "get_" ma non sono questi,
-    # dovrai rendere il pattern più specifico (es. "^get_(price|ma_signal|breakout_signal)_")
-    application.add_handler(CallbackQueryHandler(handle_button_click, pattern="^get_"))
-
-    logger.info("Bot avviato. In polling...")
-    # Avvia il bot in polling. run_polling blocca l'esecuzione.
-    application.run_polling(poll_interval=3.0, timeout=10) # Aggiunto un timeout per run_polling
+    # Handler per i click sui pulsanti inline: uno per pulsante, ognuno con la sua callback_data esatta
+    application.add_handler(CallbackQueryHandler(price_button, pattern=_CB_PRICE_RE))
+    application.add_handler(CallbackQueryHandler(ma_button, pattern=_CB_MA_RE))
+    application.add_handler(CallbackQueryHandler(breakout_button, pattern=_CB_BREAKOUT_RE))
+
+    if WEBHOOK_HOST:
+        logger.info(f"Bot avviato. In ascolto via webhook su https://{WEBHOOK_HOST}/...")
+        # Telegram invia ogni update appena arriva: nessuna attesa tra un polling e l'altro.
+        # run_webhook registra il webhook su Telegram e blocca l'esecuzione.
+        application.run_webhook(
+            listen="0.0.0.0",
+            port=WEBHOOK_PORT,
+            url_path=BOT_TOKEN,
+            webhook_url=f"https://{WEBHOOK_HOST}/{BOT_TOKEN}",
+            secret_token=WEBHOOK_SECRET,
+            cert=WEBHOOK_CERT,
+            key=WEBHOOK_KEY,
+        )
+    else:
+        logger.info("Bot avviato. In polling...")
+        # Avvia il bot in polling. run_polling blocca l'esecuzione.
+        application.run_polling(poll_interval=3.0, timeout=10) # Aggiunto un timeout per run_polling
 
 # --- Esegui la Funzione Principale ---
 if __name__ == "__main__":